@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Gmail Autocomplete Builder - asyncio IMAP Engine
+Keeps several UID FETCH commands in flight over a few connections from one event loop
+"""
+
+import asyncio
+import re
+from collections import deque
+
+from gmail_autocomplete_fetch import (BATCH_SIZE, PIPELINE_DEPTH, STRATEGY_ITEMS, fetch_item_dict,
+                                      message_from_items, parse_sexp)
+
+_LITERAL_RE = re.compile(rb'\{(\d+)\+?\}\r\n$')
+
+# Seconds between checks of a paused ScanProgress; the event loop keeps running meanwhile
+PAUSE_POLL_SECONDS = 0.1
+
+
+class AsyncImapError(Exception):
+    """An IMAP command failed or the connection dropped"""
+
+
+def quote(value):
+    """Quote a string argument for an IMAP command"""
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+class AsyncImapClient:
+    """Minimal asyncio IMAP4rev1 client: LOGIN, EXAMINE and pipelined UID FETCH"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.unsolicited = []
+        self._tag = 0
+        self._pending = deque()
+        self._read_task = None
+
+    @classmethod
+    async def connect(cls, host, port, ssl_context=None, wrap=None):
+        """Open a connection and start reading responses in the background
+
+        wrap(reader, writer) may return stand-ins for the streams, e.g. to record them.
+        """
+        reader, writer = await asyncio.open_connection(host, port, ssl=ssl_context, limit=2 ** 20)
+        if wrap:
+            reader, writer = wrap(reader, writer)
+        return await cls.start(reader, writer)
+
+    @classmethod
+    async def start(cls, reader, writer):
+        """Read the greeting on open streams and start reading responses in the background"""
+        client = cls(reader, writer)
+        greeting = await client._read_response()
+        if not greeting.startswith((b'* OK', b'* PREAUTH')):
+            writer.close()
+            raise AsyncImapError(f"Unexpected greeting: {greeting!r}")
+        client._read_task = asyncio.ensure_future(client._read_loop())
+        return client
+
+    async def _read_response(self):
+        """Read one complete response line, with any literals kept inline"""
+        parts = []
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                raise AsyncImapError("Connection closed by server")
+            parts.append(line)
+            match = _LITERAL_RE.search(line)
+            if not match:
+                return b''.join(parts)
+            parts.append(await self.reader.readexactly(int(match.group(1))))
+
+    async def _read_loop(self):
+        """Hand each response to the command it belongs to"""
+        try:
+            while True:
+                response = await self._read_response()
+                if response.startswith(b'* '):
+                    # Servers answer pipelined commands in order, so untagged
+                    # data belongs to the oldest command still running
+                    (self._pending[0][1] if self._pending else self.unsolicited).append(response)
+                    continue
+                tag, _, rest = response.partition(b' ')
+                for entry in self._pending:
+                    if entry[0] == tag:
+                        self._pending.remove(entry)
+                        status, _, text = rest.rstrip(b'\r\n').partition(b' ')
+                        if not entry[2].done():
+                            entry[2].set_result((status.upper(), text, entry[1]))
+                        break
+        except Exception as e:
+            while self._pending:
+                future = self._pending.popleft()[2]
+                if not future.done():
+                    future.set_exception(AsyncImapError(str(e)))
+
+    async def command(self, line):
+        """Send a tagged command and return its untagged responses once it completes"""
+        self._tag += 1
+        tag = f'G{self._tag:05d}'.encode('ascii')
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((tag, [], future))
+        self.writer.write(tag + b' ' + line.encode('ascii') + b'\r\n')
+        await self.writer.drain()
+        status, text, untagged = await future
+        if status != b'OK':
+            raise AsyncImapError(f"{line.split()[0]} failed: {text.decode('utf-8', errors='ignore')}")
+        return untagged
+
+    async def login(self, user, password):
+        """Authenticate with a plain LOGIN"""
+        await self.command(f'LOGIN {quote(user)} {quote(password)}')
+
+    async def examine(self, folder):
+        """Select a folder read-only"""
+        await self.command(f'EXAMINE {quote(folder)}')
+
+    async def uid_fetch(self, msg_set, items, progress=None):
+        """UID FETCH, returning the parsed {name: value} dict of each message"""
+        untagged = await self.command(f'UID FETCH {msg_set} {items}')
+        if progress:
+            progress.received(sum(map(len, untagged)))
+        parsed = parse_sexp(b''.join(untagged))
+        return [fetch_item_dict(item) for item in parsed if isinstance(item, list)]
+
+    async def logout(self):
+        """Log out and close the connection"""
+        try:
+            await self.command('LOGOUT')
+        except Exception:
+            pass
+        if self._read_task:
+            self._read_task.cancel()
+        self.writer.close()
+
+
+class AsyncFetchEngine:
+    """Fetches a FetchPlan over several connections from a single event loop"""
+
+    def __init__(self, connect, folder, connections=3, pipeline=PIPELINE_DEPTH, progress=None):
+        # connect() must be a coroutine returning a logged-in AsyncImapClient
+        self.connect = connect
+        self.folder = folder
+        self.connections = max(1, connections)
+        self.pipeline = max(1, pipeline)
+        # Optional ScanProgress told the size of every FETCH response; pausing it
+        # holds back new batches while in-flight ones finish, cancelling it ends the plan early
+        self.progress = progress
+
+    def run(self, plan, on_batch, batch_size=BATCH_SIZE, strategy='headers'):
+        """Fetch the plan, calling on_batch(index, messages) for every batch
+
+        Batches finish out of order; index is the batch's position in the plan.
+        messages holds (uid, internaldate, payload) tuples as in the sync engine.
+        """
+        asyncio.run(self._run(plan, on_batch, batch_size, strategy))
+
+    async def _run(self, plan, on_batch, batch_size, strategy):
+        # One shared iterator hands out batches, so busy connections take fewer
+        batches = enumerate(plan.batches(batch_size))
+        clients = await asyncio.gather(*(self._open() for _ in range(self.connections)))
+        try:
+            await asyncio.gather(*(self._fetch_loop(client, batches, on_batch, strategy)
+                                   for client in clients for _ in range(self.pipeline)))
+        finally:
+            await asyncio.gather(*(client.logout() for client in clients))
+
+    async def _open(self):
+        client = await self.connect()
+        await client.examine(self.folder)
+        return client
+
+    async def _proceed(self):
+        """ScanProgress.proceed() for the event loop: wait out a pause without blocking other reads"""
+        if not self.progress:
+            return True
+        while self.progress.paused:
+            await asyncio.sleep(PAUSE_POLL_SECONDS)
+        return not self.progress.cancelled
+
+    async def _fetch_loop(self, client, batches, on_batch, strategy):
+        """Keep one FETCH in flight on client until the plan runs out"""
+        items = STRATEGY_ITEMS[strategy]
+        # Wait before taking a batch, so a pause or cancel never strands one
+        while await self._proceed():
+            batch = next(batches, None)
+            if batch is None:
+                return
+            index, msg_set = batch
+            results = await client.uid_fetch(msg_set, items, self.progress)
+            messages = [message for message in (message_from_items(result, strategy) for result in results)
+                        if message]
+            on_batch(index, messages)
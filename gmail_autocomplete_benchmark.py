@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+Gmail Autocomplete Builder - Benchmarks
+Checks recipient extraction and CSV export, times the recipient parsers and
+each scan stage on a synthetic header corpus (optionally against a saved
+baseline), checks --approximate counting against exact counts, and with
+--scan measures whole scans against the local IMAP test server
+"""
+
+import argparse
+import contextlib
+import csv
+from datetime import date
+import imaplib
+import io
+import json
+import multiprocessing
+import os
+import ssl
+import sys
+import tempfile
+import time
+
+from gmail_autocomplete_builder import GmailAutocompleteBuilder
+from gmail_autocomplete_contacts import RANKINGS, ContactStore
+from gmail_autocomplete_corpus import synthetic_headers
+from gmail_autocomplete_fakeserver import (CAPABILITIES, FakeImapServer, Mailbox, generate_mailbox, load_mailbox,
+                                          make_self_signed_cert)
+from gmail_autocomplete_fetch import PIPELINE_DEPTH, STRATEGY_ITEMS, plan_fetch
+from gmail_autocomplete_parse import (decode_cache_stats, decode_header_bytes, decode_recipients,
+                                      extract_email_addresses, extract_email_addresses_split,
+                                      normalize_header_batch, parse_header_batch, parse_header_batch_email,
+                                      tokenize_recipients)
+from gmail_autocomplete_sketch import ApproximateContacts
+
+try:
+    import resource
+except ImportError:
+    # Windows: peak memory is not reported
+    resource = None
+
+# Fetch strategies compared by --scan: (label, scan_sent_folder arguments)
+SCAN_CASES = [
+    ('headers', dict(strategy='headers')),
+    ('envelope', dict(strategy='envelope')),
+    ('headers, pipelined', dict(strategy='headers', pipeline=PIPELINE_DEPTH)),
+    ('envelope, pipelined', dict(strategy='envelope', pipeline=PIPELINE_DEPTH)),
+    ('headers, 4 connections', dict(strategy='headers', connections=4)),
+    ('headers, async', dict(strategy='headers', engine='async', connections=4)),
+    ('envelope, async', dict(strategy='envelope', engine='async', connections=4)),
+]
+
+
+def best_time(work, repeat):
+    """Best wall time of work() over repeat runs"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        work()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_header_parsers(count, repeat):
+    """Compare the memoryview header parser with the email.message_from_bytes baseline"""
+    messages = synthetic_headers(count)
+    print(f"\nHeader parsers on {count} synthetic messages (best of {repeat}):")
+
+    if normalize_header_batch(parse_header_batch(messages)) != normalize_header_batch(parse_header_batch_email(messages)):
+        print("✗ Parsers disagree on the synthetic corpus")
+        return False
+    print("✓ Both parsers produce the same recipients")
+
+    baseline = best_time(lambda: normalize_header_batch(parse_header_batch_email(messages)), repeat)
+
+    def parse_cold():
+        # Every run starts with an empty decode cache, as a fresh scan does
+        decode_header_bytes.cache_clear()
+        normalize_header_batch(parse_header_batch(messages))
+
+    fast = best_time(parse_cold, repeat)
+    print(f"  email.message_from_bytes: {baseline:.3f}s ({count / baseline:,.0f} msgs/sec)")
+    print(f"  memoryview header parser: {fast:.3f}s ({count / fast:,.0f} msgs/sec)")
+    print(f"  Header decode cache: {decode_cache_stats()}")
+    print(f"  Speedup: {baseline / fast:.1f}x")
+    return True
+
+
+def bench_address_tokenizer(count, repeat):
+    """Compare the batch address tokenizer with per-value comma splitting"""
+    values = [', '.join(values) for date_str, values in parse_header_batch(synthetic_headers(count))]
+    print(f"\nAddress extraction on {count} synthetic messages (best of {repeat}):")
+    
+    # The corpus has no quoted commas or groups, where the two are meant to differ
+    if tokenize_recipients(values) != [extract_email_addresses_split(value) for value in values]:
+        print("✗ Tokenizer and comma splitting disagree on the synthetic corpus")
+        return False
+    print("✓ Both produce the same recipients")
+    
+    baseline = best_time(lambda: [extract_email_addresses_split(value) for value in values], repeat)
+    fast = best_time(lambda: tokenize_recipients(values), repeat)
+    print(f"  comma splitting:  {baseline:.3f}s ({baseline / count * 1e6:.1f} µs/msg)")
+    print(f"  batch tokenizer:  {fast:.3f}s ({fast / count * 1e6:.1f} µs/msg)")
+    print(f"  Speedup: {baseline / fast:.1f}x")
+    return True
+
+
+def check_approximate(count, top=50):
+    """Check ApproximateContacts against exact ContactStore counts and its documented bounds
+
+    Small sketches are used so the error bounds are actually exercised.
+    """
+    exact, approximate = ContactStore(), ApproximateContacts(capacity=4 * top, width=128, depth=4, precision=10)
+    for sent, addresses in normalize_header_batch(parse_header_batch(synthetic_headers(count))):
+        exact.record(addresses, sent)
+        approximate.record(addresses, sent)
+    print(f"\nApproximate counting on {count} synthetic messages ({len(exact)} distinct addresses):")
+    print(f"  Bounds: {approximate.error_summary()}")
+    
+    overcount, confidence = approximate.sketch.error_bound()
+    errors = [approximate.count(address) - uses for address, uses, name, last_used, score in exact.items()]
+    within = sum(1 for error in errors if error <= overcount) / len(errors)
+    distinct_error = abs(len(approximate) - len(exact)) / len(exact)
+    
+    # Every exact top address clearly above the cut-off must be in the approximate top list
+    exact_top = exact.most_common(top)
+    cutoff = exact_top[-1][1] + overcount
+    kept = {address for address, uses, name, last_used, score in approximate.most_common(top)}
+    missed = [address for address, uses, name, last_used, score in exact_top if uses > cutoff and address not in kept]
+    
+    checks = [
+        (min(errors) >= 0, "no count is underestimated"),
+        (within >= confidence, f"{within:.1%} of counts within the Count-Min bound (needs {confidence:.0%})"),
+        (distinct_error <= 3 * approximate.distinct.relative_error(),
+         f"distinct count off by {distinct_error:.1%} (allowed {3 * approximate.distinct.relative_error():.1%})"),
+        (not missed, f"top {top} keeps every clearly frequent address ({len(missed)} missed)"),
+    ]
+    for passed, message in checks:
+        print(f"{'✓' if passed else '✗'} {message}")
+    return all(passed for passed, message in checks)
+
+
+# extract_email_addresses inputs and the (address, name) pairs they must give, own address me@example.com
+EXTRACTION_CASES = [
+    ('bob@example.org', [('bob@example.org', '')]),
+    ('Bob Jones <Bob@Example.org>', [('bob@example.org', 'Bob Jones')]),
+    ('"Jones, Bob" <bob@example.org>, carol@example.net',
+     [('bob@example.org', 'Jones, Bob'), ('carol@example.net', '')]),
+    ('"Say \\"Hi\\"" <hi@example.org>', [('hi@example.org', 'Say "Hi"')]),
+    ('Team: a@example.com, "Doe, Jane" <jane@example.org>;, bob@example.net',
+     [('a@example.com', ''), ('jane@example.org', 'Doe, Jane'), ('bob@example.net', '')]),
+    ('undisclosed-recipients:;', []),
+    ('Me <ME@example.com>, dave@example.org', [('dave@example.org', '')]),
+    ('<eve@example.org> (comment)', [('eve@example.org', '')]),
+    ('not an address', []),
+    ('"Bar <bar@x.com>" <bar2@y.com>', [('bar2@y.com', 'Bar <bar@x.com>')]),
+    ('=?UTF-8?Q?Foo_=3Cfoo=40x.com=3E?= <real@x.com>', [('real@x.com', 'Foo <foo@x.com>')]),
+]
+
+
+def check_extraction():
+    """Check decoding and extract_email_addresses on the header forms they have to handle"""
+    print("\nRecipient extraction:")
+    failures = 0
+    for value, expected in EXTRACTION_CASES:
+        found = extract_email_addresses(decode_recipients(value), 'me@example.com')
+        if found != expected:
+            failures += 1
+            print(f"✗ {value!r}: got {found}, expected {expected}")
+    print(f"{'✓' if not failures else '✗'} {len(EXTRACTION_CASES) - failures}/{len(EXTRACTION_CASES)} header forms parsed as expected")
+    return not failures
+
+
+def check_fetch_plans(messages=3000, limit=100):
+    """Check plan_fetch keeps the newest filtered UIDs of a folder with gaps, with and without ESEARCH"""
+    # Every third message, so filtered matches are never a dense UID span
+    mailbox = Mailbox(generate_mailbox(messages).messages[::3])
+    since = date(2020, 1, 15)
+    cases = [('--since', None), ('--since on a resumed scan', mailbox.uids[-limit // 2])]
+    print("\nFetch plans:")
+    checks = []
+    without_esearch = tuple(capability for capability in CAPABILITIES if capability != b'ESEARCH')
+    for capabilities, server_label in ((CAPABILITIES, 'ESEARCH'), (without_esearch, 'plain SEARCH')):
+        with FakeImapServer(mailbox, capabilities=capabilities) as server:
+            imap = imaplib.IMAP4('127.0.0.1', server.port)
+            imap.login('me@example.com', 'password')
+            _, data = imap.select(f'"{mailbox.name}"', readonly=True)
+            exists = int(data[0])
+            for label, min_uid in cases:
+                plan = plan_fetch(imap, limit, exists, min_uid, since=since)
+                expected = [uid for uid, sent, _ in mailbox.messages
+                            if sent.date() >= since and uid >= (min_uid or 0)][-limit:]
+                checks.append((plan.uids == expected, f"{label} plans the newest {len(expected)} matches ({server_label})"))
+            imap.logout()
+    for passed, message in checks:
+        print(f"{'✓' if passed else '✗'} {message}")
+    return all(passed for passed, message in checks)
+
+
+def filled_builder(contacts):
+    """Builder holding contacts, given as (address, count, name, last_used) rows, without connecting"""
+    builder = GmailAutocompleteBuilder('me@example.com')
+    for address, count, name, last_used in contacts:
+        builder.email_addresses.add(address, count, name, last_used)
+    return builder
+
+
+def check_export():
+    """Check export_to_csv's columns, quoting, ranking and --top cut-off"""
+    now = int(time.time())
+    builder = filled_builder([
+        ('old@example.org', 5, 'Smith, John', now - 3 * 365 * 86400),
+        ('new@example.net', 2, 'Jane "JJ" Doe', now - 86400),
+        ('bare@example.com', 1, '', now - 3 * 365 * 86400),
+    ])
+    print("\nCSV export:")
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'contacts.csv')
+        rows = {}
+        for rank in RANKINGS:
+            with contextlib.redirect_stdout(io.StringIO()):
+                builder.export_to_csv(filename, top=2, rank=rank)
+            with open(filename, newline='', encoding='utf-8') as csvfile:
+                rows[rank] = list(csv.reader(csvfile))
+        report_written = os.path.exists(filename.replace('.csv', '_report.txt'))
+    
+    frecency_rows, count_rows = rows['frecency'], rows['count']
+    checks = [
+        (frecency_rows[0] == ['First Name', 'Last Name', 'E-mail Address', 'E-mail Display As'], "Outlook header row"),
+        (len(frecency_rows) == 3, "--top 2 exports two contacts"),
+        ([row[2] for row in frecency_rows[1:]] == ['new@example.net', 'old@example.org'],
+         "frecency ranks a recent contact above a more frequent old one"),
+        ([row[2] for row in count_rows[1:]] == ['old@example.org', 'new@example.net'], "count ranks by messages"),
+        (frecency_rows[1] == ['Jane', '"JJ" Doe', 'new@example.net', 'Jane "JJ" Doe (new@example.net)'],
+         "names with quotes survive the CSV round trip"),
+        (count_rows[1][3] == 'Smith, John (old@example.org)', "names with commas survive the CSV round trip"),
+        (report_written, "frequency report written next to the CSV"),
+    ]
+    for passed, message in checks:
+        print(f"{'✓' if passed else '✗'} {message}")
+    return all(passed for passed, message in checks)
+
+
+def bench_stages(count, repeat):
+    """Best µs per message of each scan stage on the synthetic corpus, by stage name"""
+    messages = synthetic_headers(count)
+    parsed = parse_header_batch(messages)
+    normalized = normalize_header_batch(parsed)
+    values = [value for date_str, header_values in parsed for value in header_values]
+    store = ContactStore()
+    for sent, addresses in normalized:
+        store.record(addresses, sent)
+    builder = filled_builder((address, uses, name, last_used) for address, uses, name, last_used, score in store.items())
+    
+    def parse():
+        decode_header_bytes.cache_clear()
+        parse_header_batch(messages)
+    
+    def aggregate():
+        counters = ContactStore()
+        for sent, addresses in normalized:
+            counters.record(addresses, sent)
+    
+    def export():
+        with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+            builder.export_to_csv(os.path.join(directory, 'contacts.csv'))
+    
+    stages = {
+        'parse': parse,
+        'normalize': lambda: normalize_header_batch(parsed),
+        'aggregate': aggregate,
+        'extract_email_addresses': lambda: [extract_email_addresses(value) for value in values],
+        'export_to_csv': export,
+    }
+    print(f"\nScan stages on {count} synthetic messages (best of {repeat}):")
+    timings = {}
+    for name, work in stages.items():
+        timings[name] = best_time(work, repeat) / count * 1e6
+        print(f"  {name:<24} {timings[name]:8.2f} µs/msg")
+    return timings
+
+
+def compare_baseline(timings, path, tolerance):
+    """Check stage timings against a saved baseline, allowing tolerance slowdown"""
+    with open(path, encoding='utf-8') as baseline_file:
+        baseline = json.load(baseline_file)['stages']
+    print(f"\nAgainst baseline {path} (tolerance {tolerance:.0%}):")
+    ok = True
+    for name, micros in timings.items():
+        if name not in baseline:
+            print(f"  {name}: no baseline")
+            continue
+        change = micros / baseline[name] - 1
+        passed = change <= tolerance
+        ok = ok and passed
+        print(f"{'✓' if passed else '✗'} {name}: {micros:.2f} µs/msg vs {baseline[name]:.2f} ({change:+.0%})")
+    return ok
+
+
+def save_baseline(timings, path, count):
+    """Write stage timings for later --baseline runs"""
+    with open(path, 'w', encoding='utf-8') as baseline_file:
+        json.dump({'messages': count, 'stages': timings}, baseline_file, indent=2)
+    print(f"✓ Saved baseline to {path}")
+
+
+def peak_rss():
+    """Peak resident memory of this process in bytes, or None where it cannot be read"""
+    # Linux: VmHWM, since ru_maxrss also counts the parent a spawned process was forked from
+    try:
+        with open('/proc/self/status', encoding='ascii') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, other Unixes kilobytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _scan_once(host, port, certfile, messages, options, results):
+    """Run one scan against the test server and report (ok, seconds, contacts, peak RSS)
+
+    Runs in a fresh process so peak RSS belongs to this scan alone.
+    """
+    builder = GmailAutocompleteBuilder('me@example.com', 'password')
+    builder.imap_host, builder.imap_port = host, port
+    builder.ssl_context = ssl.create_default_context(cafile=certfile) if certfile else None
+    with contextlib.redirect_stdout(io.StringIO()):
+        ok = builder.connect()
+        started = time.perf_counter()
+        ok = ok and builder.scan_sent_folder(max_messages=messages, **options)
+        elapsed = time.perf_counter() - started
+        builder.disconnect()
+    results.put((ok, elapsed, len(builder.email_addresses), peak_rss()))
+
+
+def bench_scans(count, latency=0.0, bandwidth=None, tls=False, corpus=None):
+    """Time scan_sent_folder under each fetch strategy against the local IMAP test server
+
+    The server serves count generated messages, or the first count of an
+    mbox/Maildir corpus (see gmail_autocomplete_corpus.py).
+    """
+    mailbox = load_mailbox(corpus, count) if corpus else generate_mailbox(count)
+    count = len(mailbox)
+    mailbox.prepare(STRATEGY_ITEMS.values())
+    network = f"{latency * 1000:.0f} ms latency, " + (f"{bandwidth / 1e6:g} MB/s" if bandwidth else "unlimited bandwidth")
+    print(f"\nScans of {count} {'corpus' if corpus else 'synthetic'} messages ({mailbox.size / 1e6:.1f} MB) over "
+          f"{'TLS' if tls else 'plain IMAP'}, {network}:")
+    
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as directory:
+        certfile, keyfile = make_self_signed_cert(directory) if tls else (None, None)
+        host = 'localhost' if tls else '127.0.0.1'
+        with FakeImapServer(mailbox, latency, bandwidth, certfile, keyfile) as server:
+            found = set()
+            for label, options in SCAN_CASES:
+                server.reset_stats()
+                results = context.Queue()
+                worker = context.Process(target=_scan_once, args=(host, server.port, certfile, count, options, results))
+                worker.start()
+                ok, elapsed, contacts, rss = results.get()
+                worker.join()
+                if not ok:
+                    print(f"✗ {label}: scan failed")
+                    return False
+                found.add(contacts)
+                rss_text = f"{rss / 1e6:6.1f} MB peak RSS" if rss else "peak RSS n/a"
+                print(f"  {label:<24} {count / elapsed:8,.0f} msgs/sec  "
+                      f"{server.stats['sent'] / 1e6:7.2f} MB received  {rss_text}")
+    
+    if len(found) > 1:
+        print(f"✗ Strategies disagree on the number of contacts: {sorted(found)}")
+        return False
+    print(f"✓ Every strategy found the same {found.pop()} contacts")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Gmail Autocomplete Builder parsers and scans')
+    parser.add_argument('--messages', type=int, default=20000, help='Synthetic messages to parse (default: 20000)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per parser; the best is reported (default: 3)')
+    parser.add_argument('--scan', action='store_true',
+                        help='Instead, time whole scans against a local IMAP test server for each fetch strategy')
+    parser.add_argument('--scan-messages', type=int, default=5000, help='Messages in the test mailbox (default: 5000)')
+    parser.add_argument('--latency', type=float, default=0, help='Milliseconds added to every server reply (default: 0)')
+    parser.add_argument('--bandwidth', type=float, help='Server bandwidth per connection in MB/s (default: unlimited)')
+    parser.add_argument('--tls', action='store_true', help='Serve IMAPS with a throwaway self-signed certificate (needs openssl)')
+    parser.add_argument('--scan-corpus', help='Serve an mbox file or Maildir from gmail_autocomplete_corpus.py instead')
+    parser.add_argument('--baseline', help='Fail if a scan stage is slower than in this saved baseline file')
+    parser.add_argument('--save-baseline', help='Save the scan stage timings to this file')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Slowdown allowed against --baseline, as a fraction (default: 0.25)')
+    args = parser.parse_args()
+
+    if args.scan:
+        ok = bench_scans(args.scan_messages, args.latency / 1000,
+                         args.bandwidth * 1e6 if args.bandwidth else None, args.tls, args.scan_corpus)
+        raise SystemExit(0 if ok else 1)
+
+    ok = check_extraction()
+    ok = check_export() and ok
+    ok = check_fetch_plans() and ok
+    ok = bench_header_parsers(args.messages, args.repeat) and ok
+    ok = bench_address_tokenizer(args.messages, args.repeat) and ok
+    ok = check_approximate(args.messages) and ok
+    timings = bench_stages(args.messages, args.repeat)
+    if args.baseline:
+        ok = compare_baseline(timings, args.baseline, args.tolerance) and ok
+    if args.save_baseline:
+        save_baseline(timings, args.save_baseline, args.messages)
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
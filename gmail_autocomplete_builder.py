@@ -5,35 +5,94 @@ Scans Gmail sent messages and creates an importable contact list for Outlook aut
 """
 
 import imaplib
-import email
-from email.header import decode_header
-import re
 import csv
 import json
+import os
 from datetime import datetime
-from collections import defaultdict
 import getpass
 import argparse
 import ssl
+import signal
+import time
+import contextlib
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from gmail_autocomplete_fetch import (BATCH_SIZE, FETCH_STRATEGIES, MAX_CONNECTIONS, PIPELINE_DEPTH,
+                                      ConnectionPool, fetch_envelopes, fetch_headers,
+                                      fetch_pipelined, folder_uidvalidity, plan_fetch)
+from gmail_autocomplete_async import AsyncFetchEngine, AsyncImapClient
+from gmail_autocomplete_contacts import HALF_LIFE_DAYS, RANKINGS, ContactStore, frecency
+from gmail_autocomplete_parse import (PARSE_STAGES, count_batch, decode_cache_stats, decode_header_bytes,
+                                      extract_email_addresses)
+from gmail_autocomplete_pipeline import STAGE_MODES, batched, ignore_interrupts, run_pipeline, run_pool
+from gmail_autocomplete_progress import ScanProgress, format_progress
+from gmail_autocomplete_replay import REPLAY_TIMINGS, SessionRecorder, SessionReplay
+from gmail_autocomplete_sketch import TOP_CAPACITY, ApproximateContacts
+from gmail_autocomplete_state import CheckpointStore, default_state_path, scan_filter
+
+# Contacts listed in the frequency report
+REPORT_SIZE = 50
 
 class GmailAutocompleteBuilder:
-    def __init__(self, email_address, password=None, app_password=None):
+    IMAP_HOST = 'imap.gmail.com'
+    IMAP_PORT = 993
+    
+    def __init__(self, email_address, password=None, app_password=None, approximate=False, top_capacity=TOP_CAPACITY,
+                 half_life_days=HALF_LIFE_DAYS):
         self.email_address = email_address
         self.password = password or app_password
+        # Where to connect; the benchmarks point these at a local test server
+        self.imap_host = self.IMAP_HOST
+        self.imap_port = self.IMAP_PORT
+        self.ssl_context = ssl.create_default_context()
+        # Set to a SessionRecorder to capture the IMAP traffic, or a SessionReplay to play one back
+        self.recorder = None
+        self.replay = None
         self.imap = None
-        self.email_addresses = defaultdict(lambda: {'count': 0, 'name': '', 'last_used': None})
+        self.sent_folder = None
+        self.approximate = approximate
+        self.top_capacity = top_capacity
+        self.half_life_days = half_life_days
+        self.email_addresses = self.new_contacts()
+        # Messages, bytes and throughput of the running scan, readable from any thread;
+        # also where a scan is paused or cancelled from another thread
+        self.progress = ScanProgress()
+        self._parse_pool = None
+        # (hits, misses) of the parse workers' decode caches, one pair per batch
+        self._worker_cache_counts = []
+        
+    def open_connection(self):
+        """Open and log in a new IMAP connection to Gmail"""
+        # Connect to Gmail IMAP (plain IMAP only when ssl_context is cleared for a local server)
+        if self.replay:
+            imap = self.replay.open()
+        elif self.recorder:
+            imap = self.recorder.open(self.imap_host, self.imap_port, self.ssl_context)
+        elif self.ssl_context is None:
+            imap = imaplib.IMAP4(self.imap_host, self.imap_port)
+        else:
+            imap = imaplib.IMAP4_SSL(self.imap_host, self.imap_port, ssl_context=self.ssl_context)
         
+        # Login
+        imap.login(self.email_address, self.password)
+        return imap
+    
+    async def open_async_connection(self):
+        """Open and log in a new asyncio IMAP connection to Gmail"""
+        if self.replay:
+            client = await AsyncImapClient.start(*self.replay.open_async())
+        else:
+            client = await AsyncImapClient.connect(self.imap_host, self.imap_port, self.ssl_context,
+                                                   self.recorder.wrap_async if self.recorder else None)
+        await client.login(self.email_address, self.password)
+        return client
+    
     def connect(self):
         """Connect to Gmail via IMAP"""
         try:
-            # Create SSL context
-            context = ssl.create_default_context()
-            
-            # Connect to Gmail IMAP
-            self.imap = imaplib.IMAP4_SSL('imap.gmail.com', 993, ssl_context=context)
-            
-            # Login
-            self.imap.login(self.email_address, self.password)
+            self.imap = self.open_connection()
             print(f"✓ Connected to Gmail account: {self.email_address}")
             return True
             
@@ -45,42 +104,110 @@ class GmailAutocompleteBuilder:
             print("3. For App Password: https://myaccount.google.com/apppasswords")
             return False
     
+    def new_contacts(self):
+        """Empty contact table: exact, or fixed-memory sketches with --approximate"""
+        if self.approximate:
+            return ApproximateContacts(self.top_capacity, half_life_days=self.half_life_days)
+        return ContactStore(self.half_life_days)
+    
     def extract_email_addresses(self, email_string):
         """Extract email addresses from various email header formats"""
-        addresses = []
-        
-        # Pattern for email addresses
-        email_pattern = r'([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})'
-        
-        # Split by comma for multiple recipients
-        parts = email_string.split(',')
+        return extract_email_addresses(email_string, self.email_address)
+    
+    def record_recipients(self, addresses, sent=0, counters=None):
+        """Add one use of each (address, name) pair, sent at epoch seconds sent"""
+        if counters is None:
+            counters = self.email_addresses
+        counters.record(addresses, sent)
+    
+    def merge_counters(self, counters, into=None):
+        """Merge a worker's ContactStore into email_addresses"""
+        (self.email_addresses if into is None else into).merge(counters)
+    
+    def _report_progress(self, messages=1):
+        """Count processed messages and print progress every batch"""
+        done = self.progress.advance(messages)
+        if done // self.batch_size > (done - messages) // self.batch_size:
+            print(f"  Processed {format_progress(self.progress.snapshot())}")
+    
+    def _stages(self):
+        """Parse and normalize stages turning fetched messages into (date, addresses)"""
+        parse, normalize = PARSE_STAGES[self.strategy]
+        return [parse, functools.partial(normalize, own_address=self.email_address)]
+    
+    def _aggregate(self, batch, counters):
+        """Aggregate stage: count a batch of (date, addresses) into counters"""
+        for sent, addresses in batch:
+            self.record_recipients(addresses, sent, counters)
+        self._report_progress(len(batch))
+    
+    def _scan_plan(self, imap, plan, counters):
+        """Fetch and count the recipients of a FetchPlan over one connection"""
+        if self.pipeline > 1:
+            messages = fetch_pipelined(imap, plan, self.batch_size, self.strategy, self.pipeline, self.progress)
+        elif self.strategy == 'envelope':
+            messages = fetch_envelopes(imap, plan, self.batch_size, self.progress)
+        else:
+            messages = fetch_headers(imap, plan, self.batch_size, self.progress)
+        batches = batched(messages, self.batch_size)
         
-        for part in parts:
-            # Extract name and email
-            name = ''
-            email_addr = ''
+        if self._parse_pool:
+            # Parse, normalize and count in worker processes; merge here in order
+            work = functools.partial(count_batch, strategy=self.strategy, own_address=self.email_address,
+                                     half_life_days=self.half_life_days)
             
-            # Check for "Name <email>" format
-            if '<' in part and '>' in part:
-                name_part = part.split('<')[0].strip()
-                email_part = part.split('<')[1].split('>')[0].strip()
-                name = name_part.strip('"\'')
-                email_addr = email_part
-            else:
-                # Just email address
-                matches = re.findall(email_pattern, part)
-                if matches:
-                    email_addr = matches[0]
+            def merge(result):
+                parsed, batch_counters, cache_counts = result
+                self.merge_counters(batch_counters, counters)
+                self._worker_cache_counts.append(cache_counts)
+                self._report_progress(parsed)
+            
+            run_pool(batches, work, merge, self._parse_pool, self.parse_workers)
+        else:
+            # fetch -> parse -> normalize -> aggregate, one batch at a time
+            run_pipeline(batches, self._stages(), lambda batch: self._aggregate(batch, counters),
+                         self.stage_mode)
+        return counters
+    
+    def _scan_async(self, plan, connections):
+        """Fetch a FetchPlan with the asyncio engine, merging batches in UID order"""
+        stages = self._stages()
+        finished = {}
+        next_batch = 0
+        
+        def on_batch(index, messages):
+            nonlocal next_batch
+            # Parsing runs on the event loop between network reads
+            for stage in stages:
+                messages = stage(messages)
+            counters = ContactStore(self.half_life_days)
+            self._aggregate(messages, counters)
             
-            if email_addr and email_addr.lower() != self.email_address.lower():
-                addresses.append((email_addr.lower(), name))
+            # Batches complete out of order; merge them as soon as they are next in line
+            finished[index] = counters
+            while next_batch in finished:
+                self.merge_counters(finished.pop(next_batch))
+                next_batch += 1
         
-        return addresses
+        engine = AsyncFetchEngine(self.open_async_connection, self.sent_folder, connections, self.pipeline,
+                                  self.progress)
+        engine.run(plan, on_batch, self.batch_size, self.strategy)
     
-    def scan_sent_folder(self, max_messages=500):
+    def scan_sent_folder(self, max_messages=500, batch_size=BATCH_SIZE, connections=1,
+                         checkpoint=None, full_rescan=False, since=None, before=None, gmail_query=None,
+                         strategy='headers', engine='sync', pipeline=None, stage_mode='inline',
+                         parse_workers=1):
         """Scan sent messages for recipient email addresses"""
         print(f"\nScanning sent messages (up to {max_messages})...")
         
+        # Settings shared by every connection and stage of this scan
+        self.batch_size = batch_size
+        self.strategy = strategy
+        self.pipeline = pipeline if pipeline is not None else (PIPELINE_DEPTH if engine == 'async' else 1)
+        self.stage_mode = stage_mode
+        self.parse_workers = parse_workers
+        decode_header_bytes.cache_clear()
+        
         try:
             # Select Sent folder (try different names)
             sent_folders = ['[Gmail]/Sent Mail', 'Sent', 'INBOX.Sent', '[Gmail]/Sent']
@@ -88,7 +215,9 @@ class GmailAutocompleteBuilder:
             folder_found = False
             for folder in sent_folders:
                 try:
-                    self.imap.select(f'"{folder}"', readonly=True)
+                    _, data = self.imap.select(f'"{folder}"', readonly=True)
+                    exists = int(data[0])
+                    self.sent_folder = folder
                     folder_found = True
                     print(f"✓ Found sent folder: {folder}")
                     break
@@ -99,106 +228,141 @@ class GmailAutocompleteBuilder:
                 print("✗ Could not find sent folder")
                 return False
             
-            # Search for all messages
-            _, message_ids = self.imap.search(None, 'ALL')
-            message_ids = message_ids[0].split()
+            # Resume after the last scanned UID unless the folder was rebuilt
+            uidvalidity = folder_uidvalidity(self.imap)
+            last_uid = 0
+            window = max_messages
+            # Counts taken with other date/Gmail filters cover other messages
+            filters = scan_filter(since, before, gmail_query)
+            saved = checkpoint.load(self.email_address, self.sent_folder) if checkpoint else None
+            if saved and full_rescan:
+                print("Full rescan requested, ignoring saved checkpoint")
+            elif saved and saved[0] != uidvalidity:
+                print("Folder UIDVALIDITY changed since last run, doing a full rescan")
+            elif saved and saved[2] != self.half_life_days:
+                print("Frecency half-life changed since last run, doing a full rescan")
+            elif saved and saved[4] != filters:
+                print("--since, --before or --gmail-query changed since last run, doing a full rescan")
+            elif saved and max_messages > saved[3]:
+                # Messages older than the saved window were never counted
+                print(f"--max-messages raised since last run ({saved[3]} → {max_messages}), doing a full rescan")
+            elif saved:
+                last_uid = saved[1]
+                window = saved[3]
+                checkpoint.load_counters(self.email_address, self.sent_folder, self.email_addresses)
+                print(f"✓ Resuming after UID {last_uid} ({len(self.email_addresses)} known addresses)")
             
-            # Limit to most recent messages
-            message_ids = message_ids[-max_messages:] if len(message_ids) > max_messages else message_ids
+            # Plan the newest UIDs to fetch, letting the server apply the
+            # resume point and date/Gmail filters. A resumed scan takes every
+            # message after the checkpoint whatever the limit, or the ones
+            # between it and the newest max_messages would be skipped for good.
+            if since or before or gmail_query:
+                print("Filtering on the server:" + (f" since {since}" if since else '') +
+                      (f" before {before}" if before else '') + (f' "{gmail_query}"' if gmail_query else ''))
+            plan = plan_fetch(self.imap, max(exists, 1) if last_uid else max_messages, exists,
+                              last_uid + 1 if last_uid else None,
+                              since, before, gmail_query)
             
-            print(f"Processing {len(message_ids)} messages...")
+            print(f"Processing {len(plan)} messages...")
+            self.progress.start(len(plan))
             
-            for idx, msg_id in enumerate(message_ids, 1):
-                if idx % 50 == 0:
-                    print(f"  Processed {idx}/{len(message_ids)} messages...")
-                
-                try:
-                    # Fetch message
-                    _, msg_data = self.imap.fetch(msg_id, '(RFC822)')
-                    raw_email = msg_data[0][1]
-                    
-                    # Parse email
-                    msg = email.message_from_bytes(raw_email)
-                    
-                    # Get date
-                    date_str = msg.get('Date', '')
-                    
-                    # Process To, Cc, and Bcc fields
-                    for field in ['To', 'Cc', 'Bcc']:
-                        recipients = msg.get(field, '')
-                        if recipients:
-                            # Decode header if needed
-                            decoded = decode_header(recipients)[0]
-                            if decoded[1]:
-                                recipients = decoded[0].decode(decoded[1])
-                            elif isinstance(decoded[0], bytes):
-                                recipients = decoded[0].decode('utf-8', errors='ignore')
-                            else:
-                                recipients = decoded[0]
-                            
-                            # Extract addresses
-                            addresses = self.extract_email_addresses(recipients)
-                            
-                            for email_addr, name in addresses:
-                                self.email_addresses[email_addr]['count'] += 1
-                                if name and not self.email_addresses[email_addr]['name']:
-                                    self.email_addresses[email_addr]['name'] = name
-                                if date_str and not self.email_addresses[email_addr]['last_used']:
-                                    self.email_addresses[email_addr]['last_used'] = date_str
+            if self.pipeline > 1:
+                print(f"Pipelining {self.pipeline} fetch commands per connection")
+            if parse_workers > 1 and engine == 'sync':
+                print(f"Parsing headers in {parse_workers} worker processes")
+                self._parse_pool = ProcessPoolExecutor(max_workers=parse_workers, initializer=ignore_interrupts)
+                self._worker_cache_counts = []
+            elif parse_workers > 1:
+                print("Note: --parse-workers is ignored by the async engine, which parses on its event loop")
+            
+            if engine == 'async':
+                print(f"Using the asyncio engine with {max(1, connections)} connections")
+                self._scan_async(plan, connections)
+            elif connections > 1 and len(plan) > batch_size:
+                # Each connection fetches its own contiguous UID range
+                pool = ConnectionPool(self.open_connection, self.sent_folder, connections)
+                print(f"Using {pool.size} parallel connections")
+                work = lambda imap, shard: self._scan_plan(imap, shard, self.new_contacts())
                 
-                except Exception as e:
-                    continue
+                # Merge in UID order so first-seen names match a serial scan
+                for counters in pool.map(work, plan):
+                    self.merge_counters(counters)
+            else:
+                self._scan_plan(self.imap, plan, self.email_addresses)
             
-            print(f"✓ Found {len(self.email_addresses)} unique email addresses")
+            if self.progress.cancelled:
+                # Shards and out-of-order batches leave gaps, so there is no single UID to resume after
+                print(f"Scan cancelled after {self.progress.done}/{len(plan)} messages, "
+                      f"keeping the addresses found so far")
+                if checkpoint:
+                    print("Note: the checkpoint is not updated by a cancelled scan")
+            elif checkpoint:
+                checkpoint.save(self.email_address, self.sent_folder, uidvalidity,
+                                max(plan.last_uid, last_uid), self.email_addresses, self.half_life_days, window, filters)
+            
+            if self.approximate:
+                print(f"✓ Found about {len(self.email_addresses)} unique email addresses")
+                print(f"  Approximate counts: {self.email_addresses.error_summary()}")
+            else:
+                print(f"✓ Found {len(self.email_addresses)} unique email addresses")
+            
+            # Parse workers report their caches per batch; stage processes keep theirs to themselves
+            if self._parse_pool:
+                cache_stats = decode_cache_stats(self._worker_cache_counts)
+            elif engine == 'sync' and stage_mode == 'processes' and strategy == 'headers':
+                cache_stats = "not available with --stages processes"
+            else:
+                cache_stats = decode_cache_stats()
+            if cache_stats:
+                print(f"  Header decode cache: {cache_stats}")
             return True
             
         except Exception as e:
             print(f"✗ Error scanning messages: {e}")
             return False
+        
+        finally:
+            if self._parse_pool:
+                self._parse_pool.shutdown(cancel_futures=True)
+                self._parse_pool = None
     
-    def export_to_csv(self, filename='outlook_contacts.csv'):
-        """Export to CSV format that Outlook can import"""
+    def export_to_csv(self, filename='outlook_contacts.csv', top=None, rank='frecency'):
+        """Export to CSV format that Outlook can import, optionally only the top N contacts"""
         print(f"\nExporting to CSV: {filename}")
         
-        # Sort by frequency of use
-        sorted_addresses = sorted(self.email_addresses.items(), 
-                                 key=lambda x: x[1]['count'], 
-                                 reverse=True)
+        # Best ranked first (recent and frequent, or just frequent); with top,
+        # a heap picks them without sorting the long tail
+        sorted_addresses = self.email_addresses.most_common(top, rank)
+        now = time.time()
+        report_file = filename.replace('.csv', '_report.txt')
         
-        with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
+        # The CSV and the frequency report are written in one pass
+        with open(filename, 'w', newline='', encoding='utf-8') as csvfile, \
+                open(report_file, 'w', encoding='utf-8') as report:
             # Outlook-compatible CSV headers
-            fieldnames = ['First Name', 'Last Name', 'E-mail Address', 'E-mail Display As']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
+            writer = csv.writer(csvfile)
+            writer.writerow(['First Name', 'Last Name', 'E-mail Address', 'E-mail Display As'])
+            report.write("Email Address Frequency Report\n")
+            report.write("=" * 50 + "\n\n")
             
-            for email_addr, info in sorted_addresses:
-                display_name = info['name'] if info['name'] else email_addr
-                
+            for position, (email_addr, count, name, last_used, score) in enumerate(sorted_addresses):
                 # Split name into first/last
-                name_parts = info['name'].split() if info['name'] else []
+                name_parts = name.split() if name else []
                 first_name = name_parts[0] if name_parts else ''
                 last_name = ' '.join(name_parts[1:]) if len(name_parts) > 1 else ''
                 
-                writer.writerow({
-                    'First Name': first_name,
-                    'Last Name': last_name,
-                    'E-mail Address': email_addr,
-                    'E-mail Display As': f"{display_name} ({email_addr})" if info['name'] else email_addr
-                })
-        
-        print(f"✓ Exported {len(sorted_addresses)} contacts to {filename}")
-        
-        # Also create a frequency report
-        report_file = filename.replace('.csv', '_report.txt')
-        with open(report_file, 'w', encoding='utf-8') as f:
-            f.write("Email Address Frequency Report\n")
-            f.write("=" * 50 + "\n\n")
-            
-            for email_addr, info in sorted_addresses[:50]:  # Top 50
-                f.write(f"{email_addr:<40} - {info['count']} messages\n")
-                if info['name']:
-                    f.write(f"  Name: {info['name']}\n")
+                writer.writerow([first_name, last_name, email_addr,
+                                 f"{name} ({email_addr})" if name else email_addr])
+                
+                if position < REPORT_SIZE:
+                    report.write(f"{email_addr:<40} - {count} messages, "
+                                 f"frecency {frecency(score, self.half_life_days, now):.2f}\n")
+                    if name:
+                        report.write(f"  Name: {name}\n")
         
+        skipped = len(self.email_addresses) - len(sorted_addresses)
+        print(f"✓ Exported {len(sorted_addresses)} contacts to {filename}" +
+              (f" (skipped {skipped} less frequent)" if skipped else ''))
         print(f"✓ Created frequency report: {report_file}")
         
         return filename
@@ -212,17 +376,95 @@ class GmailAutocompleteBuilder:
             except:
                 pass
 
+@contextlib.contextmanager
+def interrupt_cancels(progress):
+    """While active, the first Ctrl-C cancels the scan after the current batch and a second one aborts"""
+    def handler(signum, frame):
+        if progress.cancelled:
+            raise KeyboardInterrupt
+        print("\nCancelling after the current batch (press Ctrl-C again to abort)...")
+        progress.cancel()
+    
+    previous = signal.signal(signal.SIGINT, handler)
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGINT, previous)
+
+def parse_date(value):
+    """argparse type for YYYY-MM-DD dates"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date '{value}' (expected YYYY-MM-DD)")
+
+
+def positive_float(value):
+    """argparse type for numbers above zero"""
+    try:
+        number = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid number '{value}'")
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f"must be greater than 0, got '{value}'")
+    return number
+
+
+def positive_int(value):
+    """argparse type for whole numbers above zero"""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid whole number '{value}'")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got '{value}'")
+    return number
+
 def main():
     parser = argparse.ArgumentParser(description='Build Outlook autocomplete from Gmail sent messages')
     parser.add_argument('email', help='Your Gmail email address')
     parser.add_argument('--password', help='Your Gmail password or app password (will prompt if not provided)')
-    parser.add_argument('--max-messages', type=int, default=500, help='Maximum messages to scan (default: 500)')
+    parser.add_argument('--max-messages', type=int, default=500,
+                        help='Maximum messages to scan (default: 500). With --since, --before or --gmail-query on a '
+                             'server without ESEARCH, every matching UID is still listed before the newest are kept')
     parser.add_argument('--output', default='outlook_contacts.csv', help='Output CSV filename')
+    parser.add_argument('--top', type=positive_int, help='Only export the N best ranked contacts (default: all)')
+    parser.add_argument('--rank', choices=RANKINGS, default='frecency',
+                        help='Order contacts by recent-weighted use or by raw message count (default: frecency)')
+    parser.add_argument('--half-life', type=positive_float, default=HALF_LIFE_DAYS,
+                        help=f'Days after which a sent message counts half for frecency (default: {HALF_LIFE_DAYS})')
+    parser.add_argument('--since', type=parse_date, help='Only scan messages sent on or after this date (YYYY-MM-DD)')
+    parser.add_argument('--before', type=parse_date, help='Only scan messages sent before this date (YYYY-MM-DD)')
+    parser.add_argument('--gmail-query', help='Gmail search filter run on the server, e.g. "newer_than:2y"')
+    parser.add_argument('--connections', type=int, default=1, help=f'Parallel IMAP connections, up to {MAX_CONNECTIONS} (default: 1)')
+    parser.add_argument('--state', help='Checkpoint file for incremental rescans (default: next to the output CSV)')
+    parser.add_argument('--no-state', action='store_true', help='Do not read or write a checkpoint file')
+    parser.add_argument('--full-rescan', action='store_true', help='Ignore the checkpoint and rescan from scratch')
+    parser.add_argument('--fetch', choices=FETCH_STRATEGIES, default='headers',
+                        help='Read recipients from raw headers or from the server-parsed ENVELOPE (default: headers)')
+    parser.add_argument('--engine', choices=('sync', 'async'), default='sync',
+                        help='IMAP engine: one blocking command at a time, or asyncio with fetches in flight (default: sync)')
+    parser.add_argument('--pipeline', type=int,
+                        help=f'Fetch commands in flight per connection (default: 1 for sync, {PIPELINE_DEPTH} for async)')
+    parser.add_argument('--stages', choices=STAGE_MODES, default='inline',
+                        help='Run fetch, parse and normalize inline, on separate threads or in separate processes (default: inline)')
+    parser.add_argument('--parse-workers', type=int, default=1,
+                        help='Worker processes for header parsing, e.g. one per core (default: 1, parse in-process)')
+    parser.add_argument('--approximate', action='store_true',
+                        help='Count in fixed memory with sketches; counts may run slightly high and no checkpoint is kept')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help=f'Messages fetched per IMAP command (default: {BATCH_SIZE})')
+    session = parser.add_mutually_exclusive_group()
+    session.add_argument('--record', metavar='FILE',
+                         help='Save the IMAP traffic of this scan to a compressed log (passwords are masked)')
+    session.add_argument('--replay', metavar='FILE',
+                         help='Scan a --record log instead of Gmail; use the same scan options as the recording')
+    parser.add_argument('--replay-timing', choices=REPLAY_TIMINGS, default='original',
+                        help='Replay server data with the recorded delays or as fast as possible (default: original)')
     
     args = parser.parse_args()
     
-    # Get password if not provided
-    password = args.password
+    # Get password if not provided; a replay answers LOGIN from the recording, so any will do
+    password = args.password or ('replay' if args.replay else None)
     if not password:
         print("\nYou'll need to use an App Password for Gmail:")
         print("1. Go to https://myaccount.google.com/apppasswords")
@@ -231,12 +473,48 @@ def main():
         password = getpass.getpass(f"Enter app password for {args.email}: ")
     
     # Create builder
-    builder = GmailAutocompleteBuilder(args.email, password)
+    # Track twice the exported contacts so the top of the list is stable
+    top_capacity = max(TOP_CAPACITY, 2 * args.top) if args.top else TOP_CAPACITY
+    builder = GmailAutocompleteBuilder(args.email, password, approximate=args.approximate, top_capacity=top_capacity,
+                                       half_life_days=args.half_life)
+    
+    if args.replay:
+        builder.replay = SessionReplay(args.replay, args.replay_timing)
+        print(f"Replaying recorded IMAP session: {args.replay} ({args.replay_timing} timing)")
+    elif args.record:
+        builder.recorder = SessionRecorder(args.record)
+        print(f"Recording IMAP session to: {args.record}")
     
-    # Process
+    # Sketches only keep the frequent contacts, which is not enough to resume from;
+    # recordings must not depend on (or change) local state to replay the same way
+    checkpoint = None
+    if args.approximate and not args.no_state:
+        print("Note: --approximate does not read or write the checkpoint file")
+    elif (args.record or args.replay) and not args.no_state:
+        print("Note: --record and --replay do not read or write the checkpoint file")
+    elif not args.no_state:
+        checkpoint = CheckpointStore(args.state or default_state_path(args.output))
+    
+    # Process; Ctrl-C during the scan exports what was found next to, not over, the output
     if builder.connect():
-        if builder.scan_sent_folder(max_messages=args.max_messages):
-            csv_file = builder.export_to_csv(args.output)
+        with interrupt_cancels(builder.progress):
+            scanned = builder.scan_sent_folder(max_messages=args.max_messages, batch_size=args.batch_size,
+                                               connections=args.connections, checkpoint=checkpoint,
+                                               full_rescan=args.full_rescan, since=args.since, before=args.before,
+                                               gmail_query=args.gmail_query, strategy=args.fetch,
+                                               engine=args.engine, pipeline=args.pipeline, stage_mode=args.stages,
+                                               parse_workers=args.parse_workers)
+        output = args.output
+        if scanned and builder.progress.cancelled:
+            if builder.progress.done:
+                root, ext = os.path.splitext(args.output)
+                output = f"{root}_partial{ext or '.csv'}"
+                print(f"Note: the scan was cancelled, so the partial results go to {output}")
+            else:
+                print(f"Note: the scan was cancelled before any message was processed, {args.output} is left as is")
+                scanned = False
+        if scanned:
+            csv_file = builder.export_to_csv(output, args.top, args.rank)
             
             print("\n" + "=" * 50)
             print("SUCCESS! Next steps to import into Outlook:")
@@ -253,7 +531,15 @@ def main():
             
         builder.disconnect()
     
+    if checkpoint:
+        checkpoint.close()
+    if builder.recorder:
+        builder.recorder.close()
+        print(f"✓ Recorded {builder.recorder.bytes / 1e6:.1f} MB of IMAP traffic to {args.record}")
+    
     print("\nDone!")
 
 if __name__ == '__main__':
+    # Needed for --stages processes in PyInstaller builds
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Gmail Autocomplete Builder - Contact Store
+Per-address use counts, display names, last-used times and frecency scores in compact columns
+"""
+
+from array import array
+import heapq
+import math
+import time
+
+# Frecency: a message sent HALF_LIFE_DAYS ago counts half as much as one sent now
+HALF_LIFE_DAYS = 90
+
+# Log-score of a contact never seen with a known date
+NO_SCORE = float('-inf')
+
+RANKINGS = ('frecency', 'count')
+
+
+def decay_rate(half_life_days=HALF_LIFE_DAYS):
+    """Exponential decay per second for a half-life in days"""
+    return math.log(2) / (half_life_days * 86400)
+
+
+def log_add(a, b):
+    """log(exp(a) + exp(b)) without overflowing"""
+    if a < b:
+        a, b = b, a
+    if b == NO_SCORE:
+        return a
+    return a + math.log1p(math.exp(b - a))
+
+
+def frecency(log_score, half_life_days=HALF_LIFE_DAYS, now=None):
+    """Decayed score at now: each message counts 0.5 ** (age / half-life)"""
+    if log_score == NO_SCORE:
+        return 0.0
+    now = time.time() if now is None else now
+    return math.exp(log_score - decay_rate(half_life_days) * now)
+
+
+class ContactStore:
+    """Address table with interned ids and array-backed count/last-used/score columns
+
+    Each address maps to an integer id indexing the columns, so a contact
+    costs a dict slot and twenty bytes of array instead of a dict of its
+    own. Names live in a side table holding only contacts that have one,
+    and last_used is epoch seconds (0 when unknown).
+
+    The score column holds log(sum(exp(rate * sent))) over every dated use.
+    Adding a use is O(1), and ordering by it is ordering by the decayed
+    score sum(0.5 ** ((now - sent) / half-life)) at any fixed now.
+    """
+
+    __slots__ = ('half_life_days', '_rate', '_ids', '_counts', '_last_used', '_scores', '_names')
+
+    def __init__(self, half_life_days=HALF_LIFE_DAYS):
+        self.half_life_days = half_life_days
+        self._rate = decay_rate(half_life_days)
+        self._ids = {}
+        self._counts = array('L')
+        self._last_used = array('q')
+        self._scores = array('d')
+        self._names = {}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, address):
+        return address in self._ids
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def _intern(self, address):
+        """Id of address, adding an empty row for it if it is new"""
+        contact_id = self._ids.get(address)
+        if contact_id is None:
+            contact_id = self._ids[address] = len(self._counts)
+            self._counts.append(0)
+            self._last_used.append(0)
+            self._scores.append(NO_SCORE)
+        return contact_id
+
+    def add(self, address, count=1, name='', last_used=0, score=None):
+        """Add count uses of address; the first name seen and the latest time are kept
+
+        score is the log-score of those uses, e.g. from another store's
+        items(); without one they are scored as all sent at last_used.
+        """
+        contact_id = self._intern(address)
+        self._counts[contact_id] += count
+        if name and contact_id not in self._names:
+            self._names[contact_id] = name
+        if last_used > self._last_used[contact_id]:
+            self._last_used[contact_id] = last_used
+        if score is None and last_used and count:
+            score = self._rate * last_used + math.log(count)
+        if score is not None:
+            self._scores[contact_id] = log_add(self._scores[contact_id], score)
+
+    def record(self, addresses, last_used=0):
+        """Add one use of each (address, name) pair of a message sent at last_used"""
+        ids, counts, names = self._ids, self._counts, self._names
+        last_used_column, scores = self._last_used, self._scores
+        weight = self._rate * last_used if last_used else NO_SCORE
+        for address, name in addresses:
+            contact_id = ids.get(address)
+            if contact_id is None:
+                contact_id = self._intern(address)
+            counts[contact_id] += 1
+            if name and contact_id not in names:
+                names[contact_id] = name
+            if last_used > last_used_column[contact_id]:
+                last_used_column[contact_id] = last_used
+            if weight != NO_SCORE:
+                scores[contact_id] = log_add(scores[contact_id], weight)
+
+    def merge(self, other):
+        """Add every contact of another store, e.g. one filled by a worker"""
+        for address, count, name, last_used, score in other.items():
+            self.add(address, count, name, last_used, score)
+
+    def get(self, address):
+        """(count, name, last_used, score) for address, or None if it was never seen"""
+        contact_id = self._ids.get(address)
+        if contact_id is None:
+            return None
+        return (self._counts[contact_id], self._names.get(contact_id, ''), self._last_used[contact_id],
+                self._scores[contact_id])
+
+    def items(self):
+        """Yield (address, count, name, last_used, score) in first-seen order"""
+        counts, names, last_used, scores = self._counts, self._names, self._last_used, self._scores
+        for address, contact_id in self._ids.items():
+            yield address, counts[contact_id], names.get(contact_id, ''), last_used[contact_id], scores[contact_id]
+
+    def most_common(self, n=None, rank='count'):
+        """(address, count, name, last_used, score) rows, best ranked first
+
+        rank is 'count' or 'frecency'. With n, a heap selects the top rows
+        in O(len * log n) and only those are sorted. Ties keep first-seen
+        order either way.
+        """
+        column = self._counts if rank == 'count' else self._scores
+        if n is None:
+            top_ids = sorted(range(len(column)), key=column.__getitem__, reverse=True)
+        else:
+            top_ids = heapq.nlargest(n, range(len(column)), key=column.__getitem__)
+
+        # Only build rows for the winners
+        addresses = list(self._ids)
+        return [(addresses[contact_id], self._counts[contact_id], self._names.get(contact_id, ''),
+                 self._last_used[contact_id], self._scores[contact_id]) for contact_id in top_ids]
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Gmail Autocomplete Builder - Synthetic Mail Corpus
+Realistic-looking sent mail for the benchmarks and the local IMAP server,
+and written out as mbox or Maildir for scale testing (10k to 10M messages)
+
+Recipients follow a Zipf-like distribution, non-ASCII names are RFC 2047
+encoded, long recipient lists are folded, and optionally some messages use
+group syntax or carry a large attachment. Messages are generated one at a
+time, so memory does not grow with the corpus.
+"""
+
+import argparse
+import base64
+import os
+import random
+import re
+import time
+from datetime import datetime, timedelta, timezone
+
+FIRST_NAMES = ['Alice', 'Bob', 'Carol', 'Dave', 'Eve', 'Frank', 'Grace', 'Heidi', 'Ivan', 'Judy']
+LAST_NAMES = ['Smith', 'Jones', 'Müller', 'García', 'Nguyen', 'Øster', 'Kowalski', 'Rossi']
+DOMAINS = ['example.com', 'corp.example.org', 'mail.example.net', 'uni.example.edu']
+
+# Distinct people the synthetic sender writes to
+ADDRESS_BOOK_SIZE = 2000
+
+# First message date; each later one is sent 37 minutes after the previous
+START_DATE = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+# Group names for To: headers written with group syntax
+GROUP_NAMES = ['Project Team', 'Board', 'All Staff', 'Reading Club']
+
+# Attachment size when a message has one (see attachment_rate)
+ATTACHMENT_SIZE = 512 * 1024
+
+CORPUS_FORMATS = ('mbox', 'maildir')
+
+_FROM_LINE_RE = re.compile(rb'^(>*From )', re.MULTILINE)
+
+
+def encode_word(text):
+    """RFC 2047 B-encode text, as mail clients do for non-ASCII display names"""
+    return '=?UTF-8?B?' + base64.b64encode(text.encode('utf-8')).decode('ascii') + '?='
+
+
+def synthetic_contacts(count, seed=0):
+    """(address, name) pairs for a synthetic address book"""
+    rng = random.Random(seed)
+    contacts = []
+    for index in range(count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        addr = f"{first}.{last}{index}@{rng.choice(DOMAINS)}".lower().encode('ascii', 'ignore').decode()
+        contacts.append((addr, f"{first} {last}"))
+    return contacts
+
+
+def synthetic_recipient(rng, contacts):
+    """One recipient in a random mix of bare, named, quoted and encoded forms
+
+    Contacts are drawn with Zipf-like weights: a few people get most mail.
+    """
+    addr, name = contacts[min(int(rng.paretovariate(1.0)) - 1, len(contacts) - 1)]
+    form = rng.random()
+    if form < 0.3:
+        return addr
+    if not name.isascii():
+        return f'{encode_word(name)} <{addr}>'
+    if form < 0.6:
+        return f'"{name}" <{addr}>'
+    return f'{name} <{addr}>'
+
+
+def synthetic_recipient_lines(rng, contacts, uid, group_rate=0.0):
+    """(sent, header lines) for message uid: To/Cc/Bcc and, usually, Date
+
+    With group_rate, that share of To: headers use group syntax, a few of
+    them the empty undisclosed-recipients group.
+    """
+    lines = []
+    for field, chance in (('To', 1.0), ('Cc', 0.4), ('Bcc', 0.05)):
+        if rng.random() < chance:
+            recipients = [synthetic_recipient(rng, contacts) for _ in range(rng.choice((1, 1, 2, 3, 8)))]
+            # Long lists are folded after a comma, as Gmail sends them
+            value = ',\r\n '.join(recipients)
+            if field == 'To' and group_rate and rng.random() < group_rate:
+                value = 'undisclosed-recipients:;' if rng.random() < 0.1 else f'{rng.choice(GROUP_NAMES)}: {value};'
+            lines.append(f'{field}: {value}')
+    sent = START_DATE + timedelta(minutes=uid * 37)
+    if rng.random() < 0.98:
+        lines.append('Date: ' + sent.strftime('%a, %d %b %Y %H:%M:%S +0000'))
+    rng.shuffle(lines)
+    return sent, lines
+
+
+def synthetic_headers(count, seed=0):
+    """(uid, internaldate, header_bytes) tuples shaped like a HEADER.FIELDS fetch"""
+    rng = random.Random(seed)
+    contacts = synthetic_contacts(ADDRESS_BOOK_SIZE, seed)
+    messages = []
+    for uid in range(1, count + 1):
+        sent, lines = synthetic_recipient_lines(rng, contacts, uid)
+        internaldate = sent.strftime('%d-%b-%Y %H:%M:%S +0000')
+        messages.append((uid, internaldate, ('\r\n'.join(lines) + '\r\n\r\n').encode('ascii')))
+    return messages
+
+
+def _attachment_lines(rng, size):
+    """Base64 lines of a size-byte attachment, cut from a shared random block
+
+    Encoding fresh random bytes for every message would dominate the run
+    time of a large corpus; a random offset into one block is enough.
+    """
+    block = base64.b64encode(rng.randbytes(3 * 1024 * 1024 // 4 * 4))
+    encoded_size = (size + 2) // 3 * 4
+    while True:
+        start = rng.randrange(0, max(1, len(block) - encoded_size))
+        data = block[start:start + encoded_size]
+        while len(data) < encoded_size:
+            data += block[:encoded_size - len(data)]
+        yield b'\r\n'.join(data[i:i + 76] for i in range(0, len(data), 76))
+
+
+def synthetic_messages(count, seed=0, body_size=2048, sender='me@example.com', address_book=ADDRESS_BOOK_SIZE,
+                       group_rate=0.0, attachment_rate=0.0, attachment_size=ATTACHMENT_SIZE):
+    """Yield (uid, sent, raw_bytes) complete RFC 5322 messages with a body_size text body
+
+    attachment_rate of them are multipart/mixed with an attachment_size
+    base64 attachment.
+    """
+    rng = random.Random(seed)
+    contacts = synthetic_contacts(address_book, seed)
+    filler = b'Lorem ipsum dolor sit amet, consectetur adipiscing elit.\r\n'
+    body = (filler * (body_size // len(filler) + 1))[:body_size]
+    attachments = _attachment_lines(rng, attachment_size) if attachment_rate else None
+    for uid in range(1, count + 1):
+        sent, lines = synthetic_recipient_lines(rng, contacts, uid, group_rate)
+        lines = [f'From: {sender}', f'Subject: Synthetic message {uid}',
+                 f'Message-ID: <{uid}.{seed}@synthetic.example>'] + lines
+        if attachments and rng.random() < attachment_rate:
+            boundary = f'=_part_{uid}'
+            lines += ['MIME-Version: 1.0', f'Content-Type: multipart/mixed; boundary="{boundary}"']
+            content = b''.join([
+                f'--{boundary}\r\nContent-Type: text/plain; charset=us-ascii\r\n\r\n'.encode('ascii'), body,
+                f'\r\n--{boundary}\r\nContent-Type: application/octet-stream\r\n'
+                f'Content-Disposition: attachment; filename="file{uid}.bin"\r\n'
+                f'Content-Transfer-Encoding: base64\r\n\r\n'.encode('ascii'), next(attachments),
+                f'\r\n--{boundary}--\r\n'.encode('ascii')])
+        else:
+            content = body
+        yield uid, sent, ('\r\n'.join(lines) + '\r\n\r\n').encode('ascii') + content
+
+
+def write_mbox(path, messages, sender='me@example.com'):
+    """Write (uid, sent, raw) messages to an mbox file with LF line endings; returns bytes written"""
+    written = 0
+    with open(path, 'wb') as mbox:
+        for uid, sent, raw in messages:
+            # mboxrd: quote body lines that would read as a message separator
+            data = _FROM_LINE_RE.sub(rb'>\1', raw.replace(b'\r\n', b'\n'))
+            separator = f"From {sender} {sent.strftime('%a %b %d %H:%M:%S %Y')}\n".encode('ascii')
+            mbox.write(separator + data + b'\n')
+            written += len(separator) + len(data) + 1
+    return written
+
+
+def write_maildir(path, messages):
+    """Write (uid, sent, raw) messages as a Maildir of seen messages; returns bytes written"""
+    for subdirectory in ('cur', 'new', 'tmp'):
+        os.makedirs(os.path.join(path, subdirectory), exist_ok=True)
+    written = 0
+    for uid, sent, raw in messages:
+        data = raw.replace(b'\r\n', b'\n')
+        name = f"{int(sent.timestamp())}.{uid}.synthetic:2,S"
+        with open(os.path.join(path, 'cur', name), 'wb') as message_file:
+            message_file.write(data)
+        written += len(data)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic sent-mail corpus for scale testing')
+    parser.add_argument('path', help='mbox file or Maildir directory to write')
+    parser.add_argument('--format', choices=CORPUS_FORMATS, default='mbox', help='Corpus format (default: mbox)')
+    parser.add_argument('--messages', type=int, default=10000, help='Messages to generate (default: 10000)')
+    parser.add_argument('--contacts', type=int, default=ADDRESS_BOOK_SIZE,
+                        help=f'Distinct recipients to draw from (default: {ADDRESS_BOOK_SIZE})')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed gives the same corpus (default: 0)')
+    parser.add_argument('--body-size', type=int, default=2048, help='Text body bytes per message (default: 2048)')
+    parser.add_argument('--groups', type=float, default=0.02, help='Share of To: headers using group syntax (default: 0.02)')
+    parser.add_argument('--attachments', type=float, default=0.01,
+                        help='Share of messages with a large attachment (default: 0.01)')
+    parser.add_argument('--attachment-size', type=int, default=ATTACHMENT_SIZE,
+                        help=f'Attachment bytes (default: {ATTACHMENT_SIZE})')
+    args = parser.parse_args()
+
+    print(f"Generating {args.messages} messages into {args.path} ({args.format})...")
+    started = time.perf_counter()
+    messages = synthetic_messages(args.messages, args.seed, args.body_size, address_book=args.contacts,
+                                  group_rate=args.groups, attachment_rate=args.attachments,
+                                  attachment_size=args.attachment_size)
+    if args.format == 'mbox':
+        written = write_mbox(args.path, messages)
+    else:
+        written = write_maildir(args.path, messages)
+    elapsed = time.perf_counter() - started
+    print(f"✓ Wrote {written / 1e6:,.1f} MB in {elapsed:.1f}s ({args.messages / elapsed:,.0f} msgs/sec)")
+
+
+if __name__ == '__main__':
+    main()
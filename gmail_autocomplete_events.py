@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Gmail Autocomplete Builder - GUI Event Channel
+Queue the scan thread writes to and the Tk main loop drains once per frame
+"""
+
+import queue
+import tkinter as tk
+from datetime import datetime
+
+# Milliseconds between drains of the queue, about 30 frames a second
+FRAME_MS = 33
+
+# Events handled per frame; the rest wait for the next one so a flood cannot freeze the window
+MAX_EVENTS_PER_FRAME = 5000
+
+# Lines kept in a status log; older ones are dropped so long scans do not slow the Text widget
+MAX_LOG_LINES = 2000
+
+LOG_PREFIXES = {'error': '✗ ', 'success': '✓ '}
+LOG_COLORS = {'error': 'red', 'success': 'green'}
+
+
+class EventChannel:
+    """Thread-safe queue of (kind, args) events from a worker thread to Tk
+
+    Only the Tk thread touches widgets: it calls attach() once and a handler receives
+    every event posted since the previous frame as one list.
+    """
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+
+    def post(self, kind, *args):
+        """Queue an event from any thread"""
+        self._queue.put((kind, args))
+
+    def log(self, message, level='info'):
+        """Queue a timestamped status line"""
+        self.post('log', datetime.now().strftime("%H:%M:%S"), message, level)
+
+    def call(self, func, *args):
+        """Run func(*args) on the Tk thread, e.g. to show a dialog or re-enable a button"""
+        self.post('call', func, args)
+
+    def drain(self, limit=MAX_EVENTS_PER_FRAME):
+        """Return up to limit queued events without blocking"""
+        events = []
+        try:
+            while len(events) < limit:
+                events.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return events
+
+    def attach(self, root, handler, interval=FRAME_MS):
+        """Drain the queue every interval ms on the Tk main loop and pass non-empty batches to handler"""
+        def pump():
+            try:
+                events = self.drain()
+                if events:
+                    handler(events)
+            finally:
+                root.after(interval, pump)
+
+        root.after(interval, pump)
+
+
+def dispatch(events, on_log, on_latest=None):
+    """Split a frame of events: run calls in order, batch log lines, keep the newest args per other kind
+
+    on_log gets the frame's log lines as one list; on_latest gets {kind: args} so a
+    burst of progress updates costs a single widget update.
+    """
+    lines = []
+    latest = {}
+    for kind, args in events:
+        if kind == 'log':
+            lines.append(args)
+        elif kind == 'call':
+            if lines:
+                on_log(lines)
+                lines = []
+            func, call_args = args
+            func(*call_args)
+        else:
+            latest[kind] = args
+    if lines:
+        on_log(lines)
+    if latest and on_latest:
+        on_latest(latest)
+
+
+def append_log(text_widget, lines, max_lines=MAX_LOG_LINES):
+    """Insert (timestamp, message, level) lines into a disabled Text widget with one redraw"""
+    text_widget.config(state=tk.NORMAL)
+    # Consecutive lines of the same level go in as a single insert
+    run, run_level = [], None
+    for timestamp, message, level in lines[-max_lines:]:
+        if level != run_level and run:
+            text_widget.insert(tk.END, ''.join(run), run_level)
+            run = []
+        run_level = level
+        run.append(f"[{timestamp}] {LOG_PREFIXES.get(level, '')}{message}\n")
+    if run:
+        text_widget.insert(tk.END, ''.join(run), run_level)
+    for level, color in LOG_COLORS.items():
+        text_widget.tag_config(level, foreground=color)
+    excess = int(text_widget.index('end-1c').split('.')[0]) - 1 - max_lines
+    if excess > 0:
+        text_widget.delete('1.0', f'{excess + 1}.0')
+    text_widget.see(tk.END)
+    text_widget.config(state=tk.DISABLED)
+
+
+def clear_log(text_widget):
+    """Empty a disabled Text widget"""
+    text_widget.config(state=tk.NORMAL)
+    text_widget.delete('1.0', tk.END)
+    text_widget.config(state=tk.DISABLED)
@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+"""
+Gmail Autocomplete Builder - Local IMAP Server
+A Gmail stand-in on localhost for offline benchmarks: serves a generated Sent
+folder with optional TLS, injected latency and a bandwidth cap
+
+Only what the scanner uses is implemented: CAPABILITY, LOGIN, SELECT/EXAMINE,
+UID SEARCH (ALL, UID and sequence sets, SINCE, BEFORE, X-GM-RAW, CHARSET,
+RETURN (MIN MAX COUNT ALL) for ESEARCH), UID FETCH of HEADER.FIELDS or ENVELOPE, NOOP, CLOSE
+and LOGOUT. Any login is accepted.
+"""
+
+import asyncio
+import bisect
+import email
+import mailbox
+import os
+import re
+import shutil
+import ssl
+import subprocess
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import getaddresses, parsedate_to_datetime
+
+from gmail_autocomplete_corpus import synthetic_messages
+
+SENT_FOLDER = '[Gmail]/Sent Mail'
+CAPABILITIES = (b'IMAP4rev1', b'ESEARCH', b'X-GM-EXT-1')
+
+# Largest write made at once, so a bandwidth cap paces big responses smoothly
+_CHUNK_SIZE = 16 * 1024
+
+_TOKEN_RE = re.compile(rb'"(?:[^"\\]|\\.)*"|\([^)]*\)|\S+')
+_LITERAL_RE = re.compile(rb'\{(\d+)\+?\}\r\n$')
+_FIELDS_RE = re.compile(rb'HEADER\.FIELDS \(([^)]*)\)', re.IGNORECASE)
+_HEADER_NAME_RE = re.compile(rb'^([^:\r\n]+):', re.MULTILINE)
+
+
+class Mailbox:
+    """A read-only folder of (uid, internaldate, raw message) with ascending UIDs
+
+    FETCH items are built once per message and kept, so repeated scans time
+    the client rather than the server.
+    """
+
+    def __init__(self, messages, name=SENT_FOLDER, uidvalidity=1):
+        self.name = name
+        self.uidvalidity = uidvalidity
+        self.messages = list(messages)
+        self.uids = [uid for uid, sent, raw in self.messages]
+        self._items = {}
+
+    def __len__(self):
+        return len(self.messages)
+
+    def fetch_item(self, position, item):
+        """ENVELOPE, or the header fields in the frozenset item, of the message at position (see _item_key)"""
+        key = (position, item)
+        value = self._items.get(key)
+        if value is None:
+            raw = self.messages[position][2]
+            value = self._items[key] = envelope(raw) if item == 'ENVELOPE' else header_fields(raw, item)
+        return value
+
+    def prepare(self, fetch_items):
+        """Build the responses to FETCH item lists such as '(UID ENVELOPE)' ahead of a timed run"""
+        keys = [key for key in (_item_key(items.encode('ascii')) for items in fetch_items) if key]
+        for position in range(len(self.messages)):
+            for key in keys:
+                self.fetch_item(position, key)
+
+    @property
+    def size(self):
+        """Total bytes of all messages"""
+        return sum(len(raw) for uid, sent, raw in self.messages)
+
+
+def generate_mailbox(count, seed=0, body_size=2048):
+    """Mailbox of count synthetic sent messages (see gmail_autocomplete_corpus)"""
+    return Mailbox(synthetic_messages(count, seed, body_size))
+
+
+def load_mailbox(path, limit=None):
+    """Mailbox of the messages in an mbox file, or a Maildir directory in file name (delivery time) order
+
+    INTERNALDATE comes from each Date: header, or the previous message's
+    when it is missing. Every message is held in memory; limit caps how
+    many are loaded.
+    """
+    if os.path.isdir(path):
+        folder = mailbox.Maildir(path, create=False)
+        keys = sorted(folder.iterkeys())
+    else:
+        folder = mailbox.mbox(path, create=False)
+        keys = folder.iterkeys()
+    messages = []
+    sent = datetime(1970, 1, 1, tzinfo=timezone.utc)
+    try:
+        for key in keys:
+            raw = folder.get_bytes(key).replace(b'\r\n', b'\n').replace(b'\n', b'\r\n')
+            date = email.message_from_bytes(raw.split(b'\r\n\r\n', 1)[0])['Date']
+            try:
+                sent = parsedate_to_datetime(date) if date else sent
+            except (TypeError, ValueError):
+                pass
+            if sent.tzinfo is None:
+                sent = sent.replace(tzinfo=timezone.utc)
+            messages.append((len(messages) + 1, sent, raw))
+            if limit and len(messages) >= limit:
+                break
+    finally:
+        folder.close()
+    return Mailbox(messages)
+
+
+def make_self_signed_cert(directory):
+    """Write a localhost certificate and key with the openssl tool; returns (certfile, keyfile)"""
+    if not shutil.which('openssl'):
+        raise RuntimeError("The openssl command is needed to generate a test certificate")
+    certfile, keyfile = os.path.join(directory, 'localhost.pem'), os.path.join(directory, 'localhost.key')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                    '-subj', '/CN=localhost', '-addext', 'subjectAltName=DNS:localhost,IP:127.0.0.1',
+                    '-keyout', keyfile, '-out', certfile],
+                   check=True, capture_output=True)
+    return certfile, keyfile
+
+
+def _quote(value):
+    """IMAP quoted string, or NIL"""
+    if value is None:
+        return b'NIL'
+    if isinstance(value, str):
+        value = value.encode('utf-8', 'surrogateescape')
+    return b'"' + value.replace(b'\\', b'\\\\').replace(b'"', b'\\"') + b'"'
+
+
+def _address_list(message, field):
+    """ENVELOPE address list of a header: ((name NIL mailbox host) ...) or NIL"""
+    values = message.get_all(field)
+    if not values:
+        return b'NIL'
+    addresses = []
+    for name, address in getaddresses([str(value) for value in values]):
+        if not address:
+            # An empty group such as undisclosed-recipients:;
+            continue
+        local_part, _, host = address.partition('@')
+        addresses.append(b'(' + b' '.join((_quote(name or None), b'NIL', _quote(local_part), _quote(host))) + b')')
+    return b'(' + b''.join(addresses) + b')' if addresses else b'NIL'
+
+
+def envelope(raw):
+    """RFC 3501 ENVELOPE of a raw message; encoded words are passed through, as Gmail does"""
+    header = raw.split(b'\r\n\r\n', 1)[0] + b'\r\n\r\n'
+    message = email.message_from_bytes(header)
+    sender = _address_list(message, 'From')
+    return b'(' + b' '.join([
+        _quote(message['Date']), _quote(message['Subject']), sender, sender, sender,
+        _address_list(message, 'To'), _address_list(message, 'Cc'), _address_list(message, 'Bcc'),
+        _quote(message['In-Reply-To']), _quote(message['Message-ID'])]) + b')'
+
+
+def header_fields(raw, names):
+    """The named header fields of a raw message, folding kept, as BODY[HEADER.FIELDS (...)] returns them"""
+    header = raw.split(b'\r\n\r\n', 1)[0] + b'\r\n'
+    starts = [match.start() for match in _HEADER_NAME_RE.finditer(header)] + [len(header)]
+    kept = [header[start:end] for start, end in zip(starts, starts[1:])
+            if header[start:header.index(b':', start)].strip().upper() in names]
+    return b''.join(kept) + b'\r\n'
+
+
+def _set_ranges(spec, largest):
+    """(low, high) ranges of an IMAP sequence set such as 1:5,9,12:*"""
+    for part in spec.split(b','):
+        first, _, last = part.partition(b':')
+        low = largest if first == b'*' else int(first)
+        high = low if not last else (largest if last == b'*' else int(last))
+        yield min(low, high), max(low, high)
+
+
+def _sequence_set(numbers):
+    """Sorted numbers as a compact IMAP sequence set such as 1:5,9"""
+    ranges = []
+    for number in numbers:
+        if ranges and number == ranges[-1][1] + 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    return b','.join(b'%d' % low if low == high else b'%d:%d' % (low, high) for low, high in ranges)
+
+
+def _item_key(items):
+    """'ENVELOPE', the frozenset of HEADER.FIELDS names, or None for a FETCH item list"""
+    if b'ENVELOPE' in items.upper():
+        return 'ENVELOPE'
+    fields = _FIELDS_RE.search(items)
+    return frozenset(fields.group(1).upper().split()) if fields else None
+
+
+def _in_set(number, spec, largest):
+    """Whether number is in an IMAP sequence set"""
+    return any(low <= number <= high for low, high in _set_ranges(spec, largest))
+
+
+def _search_date(token):
+    """SEARCH date such as 01-Jan-2024, as a UTC datetime"""
+    return datetime.strptime(token.decode('ascii'), '%d-%b-%Y').replace(tzinfo=timezone.utc)
+
+
+class ImapSession:
+    """One client connection; commands run in order, replies are delayed by the server's latency
+
+    Commands are timestamped as they arrive, so pipelined commands wait out
+    their latency together instead of one after another, as they would on a
+    real network.
+    """
+
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.selected = None
+        self._sending = asyncio.Lock()
+
+    async def run(self):
+        commands = asyncio.Queue()
+        reading = asyncio.ensure_future(self._read_commands(commands))
+        try:
+            await self._send(b'* OK Gmail Autocomplete test server ready\r\n')
+            while True:
+                received, line = await commands.get()
+                if line is None:
+                    return
+                tag, command, arguments = self._split(line)
+                try:
+                    reply = self.dispatch(tag, command.upper(), arguments)
+                except Exception as e:
+                    reply = [tag + b' BAD ' + str(e).encode('ascii', 'replace') + b'\r\n']
+                delay = received + self.server.latency - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                await self._send(b''.join(reply))
+                if command.upper() == b'LOGOUT':
+                    return
+        except (ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            reading.cancel()
+            self.writer.close()
+
+    async def _read_commands(self, commands):
+        """Queue (arrival time, command line) pairs; a literal is read into its line"""
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                received = time.monotonic()
+                self.server.stats['received'] += len(line)
+                # A {n} literal: ask for it, then read it and the rest of the command
+                match = _LITERAL_RE.search(line)
+                while match:
+                    await self._send(b'+ Ready for literal\r\n')
+                    literal = await self.reader.readexactly(int(match.group(1)))
+                    rest = await self.reader.readline()
+                    self.server.stats['received'] += len(literal) + len(rest)
+                    line = line[:match.start()] + _quote(literal) + rest
+                    match = _LITERAL_RE.search(line)
+                commands.put_nowait((received, line))
+        except (ConnectionError, ssl.SSLError, asyncio.IncompleteReadError):
+            pass
+        commands.put_nowait((time.monotonic(), None))
+
+    async def _send(self, data):
+        """Write data, paced to the server's bandwidth cap, without interleaving other replies"""
+        bandwidth = self.server.bandwidth
+        async with self._sending:
+            for start in range(0, len(data), _CHUNK_SIZE):
+                chunk = data[start:start + _CHUNK_SIZE]
+                started = time.monotonic()
+                self.writer.write(chunk)
+                await self.writer.drain()
+                if bandwidth:
+                    delay = len(chunk) / bandwidth - (time.monotonic() - started)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+        self.server.stats['sent'] += len(data)
+
+    @staticmethod
+    def _split(line):
+        """(tag, command, arguments) of a command line"""
+        parts = line.rstrip(b'\r\n').split(b' ', 2)
+        parts += [b''] * (3 - len(parts))
+        return parts[0], parts[1], parts[2]
+
+    def dispatch(self, tag, command, arguments):
+        """Response lines for one command, ending with the tagged status"""
+        self.server.stats['commands'] += 1
+        done = tag + b' OK ' + command + b' completed\r\n'
+        if command == b'CAPABILITY':
+            return [b'* CAPABILITY ' + b' '.join(self.server.capabilities) + b'\r\n', done]
+        if command in (b'LOGIN', b'NOOP'):
+            return [done]
+        if command in (b'SELECT', b'EXAMINE'):
+            folder = self.server.mailbox
+            if arguments.strip(b'"').decode('utf-8', 'replace') != folder.name:
+                self.selected = None
+                return [tag + b' NO Unknown mailbox\r\n']
+            self.selected = folder
+            return [b'* %d EXISTS\r\n' % len(folder), b'* 0 RECENT\r\n',
+                    b'* OK [UIDVALIDITY %d] UIDs valid\r\n' % folder.uidvalidity,
+                    tag + b' OK [READ-ONLY] ' + command + b' completed\r\n']
+        if command == b'CLOSE':
+            self.selected = None
+            return [done]
+        if command == b'LOGOUT':
+            return [b'* BYE Logging out\r\n', done]
+        if command == b'UID' and self.selected is not None:
+            subcommand, _, arguments = arguments.partition(b' ')
+            if subcommand.upper() == b'SEARCH':
+                return self.uid_search(tag, arguments) + [done]
+            if subcommand.upper() == b'FETCH':
+                return self.uid_fetch(arguments) + [done]
+        return [tag + b' BAD Unsupported command\r\n']
+
+    def uid_search(self, tag, arguments):
+        """SEARCH or ESEARCH response for a UID SEARCH"""
+        messages = self.selected.messages
+        largest_uid = messages[-1][0] if messages else 0
+        tokens = _TOKEN_RE.findall(arguments)
+        options = None
+        if tokens and tokens[0].upper() == b'RETURN':
+            options, tokens = tokens[1], tokens[2:]
+        matches = list(enumerate(messages, 1))
+        position = 0
+        while position < len(tokens):
+            key = tokens[position].upper()
+            value = tokens[position + 1] if position + 1 < len(tokens) else b''
+            if key == b'UID':
+                matches = [(seq, m) for seq, m in matches if _in_set(m[0], value, largest_uid)]
+                position += 1
+            elif key == b'SINCE':
+                matches = [(seq, m) for seq, m in matches if m[1] >= _search_date(value)]
+                position += 1
+            elif key == b'BEFORE':
+                matches = [(seq, m) for seq, m in matches if m[1] < _search_date(value)]
+                position += 1
+            elif key in (b'X-GM-RAW', b'CHARSET'):
+                # Gmail search syntax is not interpreted; every message matches
+                position += 1
+            elif key[:1].isdigit() or key[:1] == b'*':
+                matches = [(seq, m) for seq, m in matches if _in_set(seq, key, len(messages))]
+            elif key != b'ALL':
+                raise ValueError(f"unsupported search key {key.decode('ascii', 'replace')}")
+            position += 1
+
+        uids = [message[0] for seq, message in matches]
+        if options is None:
+            return [b'* SEARCH' + b''.join(b' %d' % uid for uid in uids) + b'\r\n']
+        result = b'* ESEARCH (TAG "' + tag + b'") UID'
+        if uids:
+            result += b' MIN %d MAX %d' % (min(uids), max(uids))
+        result += b' COUNT %d' % len(uids)
+        if uids and b'ALL' in options.strip(b'()').upper().split():
+            result += b' ALL ' + _sequence_set(sorted(uids))
+        return [result + b'\r\n']
+
+    def uid_fetch(self, arguments):
+        """FETCH responses with UID, INTERNALDATE and ENVELOPE or the requested header fields"""
+        messages, uids = self.selected.messages, self.selected.uids
+        uid_set, _, items = arguments.partition(b' ')
+        key = _item_key(items)
+        fields = _FIELDS_RE.search(items)
+        # UIDs ascend, so each range of the set is a slice of the folder
+        positions = set()
+        for low, high in _set_ranges(uid_set, uids[-1] if uids else 0):
+            positions.update(range(bisect.bisect_left(uids, low), bisect.bisect_right(uids, high)))
+        responses = []
+        for position in sorted(positions):
+            seq, (uid, sent, _) = position + 1, messages[position]
+            prefix = b'* %d FETCH (UID %d INTERNALDATE "%s"' % (seq, uid,
+                                                               sent.strftime('%d-%b-%Y %H:%M:%S +0000').encode())
+            if key == 'ENVELOPE':
+                responses.append(prefix + b' ENVELOPE ' + self.selected.fetch_item(position, key) + b')\r\n')
+            elif key:
+                header = self.selected.fetch_item(position, key)
+                item = b'BODY[HEADER.FIELDS (' + fields.group(1).upper() + b')]'
+                responses.append(prefix + b' ' + item + b' {%d}\r\n' % len(header) + header + b')\r\n')
+            else:
+                responses.append(prefix + b')\r\n')
+        return responses
+
+
+class FakeImapServer:
+    """Serve a Mailbox on localhost from an event loop on a background thread
+
+    latency is seconds added to every reply, bandwidth is bytes/second per
+    connection (None for unlimited). With certfile/keyfile the server speaks
+    IMAPS; point clients at host 'localhost' so the certificate matches.
+    Byte and command counts for all connections are kept in stats.
+    """
+
+    def __init__(self, mailbox, latency=0.0, bandwidth=None, certfile=None, keyfile=None,
+                 capabilities=CAPABILITIES, host='127.0.0.1', port=0):
+        self.mailbox = mailbox
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.capabilities = capabilities
+        self.host = host
+        self.port = port
+        self.ssl_context = None
+        if certfile:
+            self.ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            self.ssl_context.load_cert_chain(certfile, keyfile)
+        self.stats = {}
+        self.reset_stats()
+        self._loop = None
+        self._thread = None
+
+    def reset_stats(self):
+        """Zero the sent/received byte and command counters"""
+        self.stats.update(sent=0, received=0, commands=0)
+
+    def start(self):
+        """Start serving in a daemon thread; returns the port"""
+        ready = threading.Event()
+        failure = []
+
+        def serve():
+            self._loop = asyncio.new_event_loop()
+            try:
+                server = self._loop.run_until_complete(asyncio.start_server(
+                    lambda reader, writer: ImapSession(self, reader, writer).run(),
+                    self.host, self.port, ssl=self.ssl_context))
+            except OSError as e:
+                failure.append(e)
+                ready.set()
+                return
+            self.port = server.sockets[0].getsockname()[1]
+            ready.set()
+            try:
+                self._loop.run_forever()
+            finally:
+                server.close()
+                self._loop.run_until_complete(server.wait_closed())
+                self._loop.close()
+
+        self._thread = threading.Thread(target=serve, daemon=True)
+        self._thread.start()
+        ready.wait()
+        if failure:
+            raise failure[0]
+        return self.port
+
+    def stop(self):
+        """Stop serving and close the listening socket"""
+        if self._thread:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,512 @@
+#!/usr/bin/env python3
+"""
+Gmail Autocomplete Builder - IMAP Fetch Engine
+Fetches only the recipient headers of sent messages, many UIDs per command
+"""
+
+import imaplib
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from email.header import decode_header, make_header
+
+# Only the headers needed to build the contact list (PEEK keeps \Seen untouched)
+HEADER_FIELDS = 'BODY.PEEK[HEADER.FIELDS (TO CC BCC DATE)]'
+FETCH_ITEMS = f'(UID INTERNALDATE {HEADER_FIELDS})'
+
+# Server-parsed date and address lists, no MIME parsing needed on our side
+ENVELOPE_ITEMS = '(UID INTERNALDATE ENVELOPE)'
+
+# Ways of getting recipients out of the server (see --fetch)
+FETCH_STRATEGIES = ('headers', 'envelope')
+STRATEGY_ITEMS = {'headers': FETCH_ITEMS, 'envelope': ENVELOPE_ITEMS}
+
+# UIDs requested per UID FETCH command
+BATCH_SIZE = 500
+
+# UID FETCH commands kept in flight on one connection when pipelining
+PIPELINE_DEPTH = 4
+
+# Gmail allows about 15 simultaneous IMAP sessions per account
+MAX_CONNECTIONS = 15
+
+# IMAP dates always use English month names, whatever the locale
+_MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+_UID_RE = re.compile(rb'UID (\d+)')
+_INTERNALDATE_RE = re.compile(rb'INTERNALDATE "([^"]*)"')
+_TOKEN_RE = re.compile(rb'''[ \t\r\n]*(?:
+    (\()                                  # list start
+  | (\))                                  # list end
+  | "((?:[^"\\]|\\.)*)"                    # quoted string
+  | \{(\d+)\+?\}\r\n                      # literal header, the bytes follow
+  | ([^ \t\r\n()"{\[]+(?:\[[^\]]*\][^ \t\r\n()"{]*)?)  # atom, e.g. BODY[HEADER.FIELDS (TO)]
+)''', re.VERBOSE)
+_LITERAL_RE = re.compile(rb'\{(\d+)\+?\}\r\n$')
+_ESCAPE_RE = re.compile(rb'\\(.)')
+_ESEARCH_RE = re.compile(rb'\b(MIN|MAX|COUNT) (\d+)', re.IGNORECASE)
+_ESEARCH_ALL_RE = re.compile(rb'\bALL ([\d:,]+)', re.IGNORECASE)
+
+
+def folder_uidvalidity(imap):
+    """UIDVALIDITY of the folder just selected, taken from the SELECT response"""
+    _, data = imap.response('UIDVALIDITY')
+    try:
+        return int(data[0])
+    except (TypeError, ValueError, IndexError):
+        return 0
+
+
+def imap_date(value):
+    """Format a date for SEARCH SINCE/BEFORE, e.g. 01-Jan-2024"""
+    return f"{value.day:02d}-{_MONTHS[value.month - 1]}-{value.year}"
+
+
+def search_criteria(min_uid=None, since=None, before=None):
+    """Build a UID SEARCH key that the server evaluates for us"""
+    keys = []
+    if min_uid:
+        keys.append(f'UID {min_uid}:*')
+    if since:
+        keys.append(f'SINCE {imap_date(since)}')
+    if before:
+        keys.append(f'BEFORE {imap_date(before)}')
+    return ' '.join(keys) or 'ALL'
+
+
+def _uid_search(imap, criteria, gmail_query=None, options=None):
+    """Send UID SEARCH, adding Gmail's X-GM-RAW key when a query is given"""
+    charset = None
+    if gmail_query:
+        if 'X-GM-EXT-1' not in imap.capabilities:
+            raise imaplib.IMAP4.error("Server does not support Gmail search (X-GM-RAW)")
+        criteria = '' if criteria == 'ALL' else criteria + ' '
+        try:
+            gmail_query.encode('ascii')
+            escaped = gmail_query.replace('\\', '\\\\').replace('"', '\\"')
+            criteria += f'X-GM-RAW "{escaped}"'
+        except UnicodeEncodeError:
+            # Non-ASCII queries go as a UTF-8 literal, which imaplib appends last
+            charset = 'CHARSET UTF-8'
+            criteria += 'X-GM-RAW'
+            imap.literal = gmail_query.encode('utf-8')
+    typ, data = imap.uid('SEARCH', options, charset, criteria)
+    if typ != 'OK':
+        raise imaplib.IMAP4.error(f"UID SEARCH failed: {data}")
+    return data
+
+
+def search_uids(imap, criteria='ALL', gmail_query=None):
+    """Return the sorted UIDs of the selected folder matching criteria
+    
+    gmail_query is passed to Gmail's X-GM-RAW search, e.g. "newer_than:2y"
+    """
+    data = _uid_search(imap, criteria, gmail_query)
+    if not data or not data[0]:
+        return []
+    return sorted(int(uid) for uid in data[0].split())
+
+
+def esearch_range(imap, criteria='ALL', gmail_query=None, with_all=False):
+    """Return (min, max, count, uid_set) of matching UIDs using ESEARCH (RFC 4731)
+    
+    uid_set is the matches as a compact sequence set such as b'3:9,12', only
+    asked for with with_all; otherwise it is None.
+    """
+    _uid_search(imap, criteria, gmail_query, 'RETURN (MIN MAX COUNT ALL)' if with_all else 'RETURN (MIN MAX COUNT)')
+    _, data = imap.response('ESEARCH')
+    result = data[-1] if data and data[-1] else b''
+    values = dict((key.upper(), int(value)) for key, value in _ESEARCH_RE.findall(result))
+    uid_set = None
+    if with_all:
+        match = _ESEARCH_ALL_RE.search(result)
+        uid_set = match.group(1) if match else b''
+    return values.get(b'MIN', 0), values.get(b'MAX', 0), values.get(b'COUNT', 0), uid_set
+
+
+def newest_uids(uid_set, limit, min_uid=0):
+    """The newest limit UIDs of a sequence set such as b'3:9,12', ascending
+    
+    Ranges are walked from the end, so only the UIDs kept are ever listed.
+    """
+    kept = []
+    for part in reversed(uid_set.split(b',') if uid_set else []):
+        first, _, last = part.partition(b':')
+        low, high = sorted((int(first), int(last or first)))
+        low = max(low, min_uid, high - (limit - len(kept)) + 1)
+        kept.extend(range(high, low - 1, -1))
+        if len(kept) >= limit:
+            break
+    kept.sort()
+    return kept
+
+
+def message_set(uids):
+    """Compress sorted UIDs into an IMAP message set such as '1:5,9,12:14'"""
+    ranges = []
+    start = prev = None
+    for uid in uids:
+        if start is None:
+            start = prev = uid
+        elif uid == prev + 1:
+            prev = uid
+        else:
+            ranges.append(f"{start}:{prev}" if prev != start else str(start))
+            start = prev = uid
+    if start is not None:
+        ranges.append(f"{start}:{prev}" if prev != start else str(start))
+    return ','.join(ranges)
+
+
+def uid_batches(uids, batch_size=BATCH_SIZE):
+    """Split sorted UIDs into message sets of at most batch_size UIDs"""
+    for start in range(0, len(uids), batch_size):
+        yield message_set(uids[start:start + batch_size])
+
+
+def shard_uids(uids, shards):
+    """Split sorted UIDs into at most `shards` contiguous, disjoint ranges"""
+    if not uids:
+        return []
+    size = -(-len(uids) // max(1, shards))
+    return [uids[start:start + size] for start in range(0, len(uids), size)]
+
+
+class FetchPlan:
+    """The UIDs to fetch: an explicit sorted list, or a dense UID span"""
+    
+    def __init__(self, uids=None, first_uid=0, last_uid=0, count=None):
+        # A span is used when every existing UID in [first_uid, last_uid]
+        # should be fetched, so the UIDs never have to be listed
+        self.uids = uids
+        if uids is not None:
+            first_uid, last_uid, count = (uids[0], uids[-1], len(uids)) if uids else (0, 0, 0)
+        self.first_uid = first_uid
+        self.last_uid = last_uid
+        self.count = count if count is not None else max(0, last_uid - first_uid + 1)
+    
+    def __len__(self):
+        return self.count
+    
+    def batches(self, batch_size=BATCH_SIZE):
+        """Yield message sets covering the plan, batch_size UIDs at a time"""
+        if self.uids is not None:
+            yield from uid_batches(self.uids, batch_size)
+            return
+        if not self.count:
+            return
+        for start in range(self.first_uid, self.last_uid + 1, batch_size):
+            yield f"{start}:{min(start + batch_size - 1, self.last_uid)}"
+    
+    def split(self, shards):
+        """Split into at most `shards` contiguous, disjoint plans"""
+        if self.uids is not None:
+            return [FetchPlan(shard) for shard in shard_uids(self.uids, shards)]
+        if not self.count:
+            return []
+        span = self.last_uid - self.first_uid + 1
+        shards = max(1, min(shards, self.count))
+        bounds = [self.first_uid + span * i // shards for i in range(shards + 1)]
+        return [FetchPlan(first_uid=bounds[i], last_uid=bounds[i + 1] - 1,
+                          count=self.count * (bounds[i + 1] - bounds[i]) // span)
+                for i in range(shards) if bounds[i + 1] > bounds[i]]
+
+
+def plan_fetch(imap, max_messages, exists, min_uid=None, since=None, before=None, gmail_query=None):
+    """Plan the newest max_messages matching UIDs, without listing them if possible
+    
+    exists is the folder's message count from SELECT.
+    """
+    filtered = bool(since or before or gmail_query)
+    criteria = search_criteria(min_uid, since, before)
+    if not filtered and exists > max_messages:
+        # Sequence numbers follow UID order, so this keeps only the newest messages
+        newest = f'{exists - max_messages + 1}:*'
+        criteria = newest if criteria == 'ALL' else f'{newest} {criteria}'
+    
+    if 'ESEARCH' in imap.capabilities:
+        # Filtered matches also come back as a sequence set, to cut the newest from if they are sparse
+        first_uid, last_uid, count, uid_set = esearch_range(imap, criteria, gmail_query, with_all=filtered)
+        # "n:*" always matches the highest UID, even when it is below n
+        first_uid = max(first_uid, min_uid or 0)
+        if not count or first_uid > last_uid:
+            return FetchPlan([])
+        if not filtered:
+            # Every message between MIN and MAX matched, gaps are expunged UIDs
+            return FetchPlan(first_uid=first_uid, last_uid=last_uid, count=count)
+        if count == last_uid - first_uid + 1:
+            # Dense matches, so the newest ones are simply the top of the span
+            first_uid = max(first_uid, last_uid - max_messages + 1)
+            return FetchPlan(first_uid=first_uid, last_uid=last_uid)
+        return FetchPlan(newest_uids(uid_set, max_messages, min_uid or 0))
+    
+    # Without ESEARCH, filtered searches list every matching UID before the newest are kept
+    uids = [uid for uid in search_uids(imap, criteria, gmail_query) if uid >= (min_uid or 0)]
+    return FetchPlan(uids[-max_messages:])
+
+
+def response_size(data):
+    """Bytes in an imaplib response list, literals included"""
+    return sum(sum(map(len, item)) if isinstance(item, tuple) else len(item or b'') for item in data)
+
+
+def parse_fetch_response(data):
+    """Yield (uid, internaldate, header_bytes) from an imaplib FETCH response"""
+    for idx, item in enumerate(data):
+        if not isinstance(item, tuple):
+            continue
+        meta, payload = item
+        # Items the server sends after the literal end up in the next element
+        if idx + 1 < len(data) and isinstance(data[idx + 1], bytes):
+            meta += data[idx + 1]
+        uid_match = _UID_RE.search(meta)
+        if not uid_match:
+            continue
+        date_match = _INTERNALDATE_RE.search(meta)
+        internaldate = date_match.group(1).decode('ascii', errors='ignore') if date_match else ''
+        yield int(uid_match.group(1)), internaldate, payload or b''
+
+
+def controlled_batches(batches, progress=None):
+    """Pass message sets through, holding back while progress is paused and stopping once it is cancelled"""
+    for msg_set in batches:
+        if progress and not progress.proceed():
+            return
+        yield msg_set
+
+
+def fetch_headers(imap, plan, batch_size=BATCH_SIZE, progress=None):
+    """Fetch recipient headers for a FetchPlan or UID list, one UID FETCH per batch
+    
+    progress, a ScanProgress, is told the size of every response and can
+    pause or cancel the scan between batches.
+    """
+    if not isinstance(plan, FetchPlan):
+        plan = FetchPlan(plan)
+    for msg_set in controlled_batches(plan.batches(batch_size), progress):
+        typ, data = imap.uid('FETCH', msg_set, FETCH_ITEMS)
+        if typ != 'OK':
+            raise imaplib.IMAP4.error(f"UID FETCH failed: {data}")
+        if progress:
+            progress.received(response_size(data))
+        yield from parse_fetch_response(data)
+
+
+def _read_response(imap):
+    """Read one complete response line from imaplib's socket, literals inline"""
+    parts = []
+    while True:
+        line = imap.readline()
+        if not line:
+            raise imaplib.IMAP4.abort("Connection closed by server")
+        parts.append(line)
+        match = _LITERAL_RE.search(line)
+        if not match:
+            return b''.join(parts)
+        parts.append(imap.read(int(match.group(1))))
+
+
+def fetch_pipelined(imap, plan, batch_size=BATCH_SIZE, strategy='headers', depth=PIPELINE_DEPTH,
+                    progress=None):
+    """Fetch a FetchPlan keeping `depth` UID FETCH commands in flight on one connection
+    
+    Commands are written back-to-back on imaplib's socket and responses are
+    matched to their tags as they arrive, so each batch no longer waits a
+    full round trip for the previous one. Yields (uid, internaldate, payload).
+    """
+    if not isinstance(plan, FetchPlan):
+        plan = FetchPlan(plan)
+    items = STRATEGY_ITEMS[strategy].encode('ascii')
+    batches = controlled_batches(plan.batches(batch_size), progress)
+    in_flight = deque()
+    sent = 0
+    
+    def send_next():
+        nonlocal sent
+        msg_set = next(batches, None)
+        if msg_set is None:
+            return
+        sent += 1
+        # Our own tag prefix never collides with imaplib's random one
+        tag = b'P%05d' % sent
+        imap.send(tag + b' UID FETCH ' + msg_set.encode('ascii') + b' ' + items + b'\r\n')
+        in_flight.append(tag)
+    
+    for _ in range(max(1, depth)):
+        send_next()
+    
+    untagged = []
+    try:
+        while in_flight:
+            response = _read_response(imap)
+            if progress:
+                progress.received(len(response))
+            if response.startswith(b'* '):
+                untagged.append(response)
+                continue
+            tag, _, rest = response.partition(b' ')
+            if tag != in_flight[0]:
+                raise imaplib.IMAP4.abort(f"Unexpected response: {response[:80]!r}")
+            in_flight.popleft()
+            if not rest.upper().startswith(b'OK'):
+                raise imaplib.IMAP4.error(f"UID FETCH failed: {rest.strip()!r}")
+            
+            # Refill the pipeline before parsing so the server keeps sending
+            send_next()
+            for entry in parse_sexp(b''.join(untagged)):
+                if isinstance(entry, list):
+                    message = message_from_items(fetch_item_dict(entry), strategy)
+                    if message:
+                        yield message
+            untagged = []
+    finally:
+        # Leave the connection usable for imaplib if we stopped early
+        try:
+            while in_flight:
+                response = _read_response(imap)
+                if response.partition(b' ')[0] == in_flight[0]:
+                    in_flight.popleft()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """Runs work over several authenticated IMAP connections in parallel"""
+    
+    def __init__(self, connect, folder, size):
+        # connect() must return a logged-in imaplib.IMAP4 instance
+        self.connect = connect
+        self.folder = folder
+        self.size = max(1, min(size, MAX_CONNECTIONS))
+    
+    def _run_shard(self, work, shard):
+        """Open a connection, select the folder and run work on one shard"""
+        imap = self.connect()
+        try:
+            typ, data = imap.select(f'"{self.folder}"', readonly=True)
+            if typ != 'OK':
+                raise imaplib.IMAP4.error(f"Could not select {self.folder}: {data}")
+            return work(imap, shard)
+        finally:
+            try:
+                imap.close()
+                imap.logout()
+            except:
+                pass
+    
+    def map(self, work, plan):
+        """Call work(imap, shard_plan) on each connection, results in UID order"""
+        shards = plan.split(self.size)
+        if not shards:
+            return []
+        with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+            return list(executor.map(lambda shard: self._run_shard(work, shard), shards))
+
+
+def parse_sexp(data, pos=0):
+    """Parse IMAP response data into nested lists
+    
+    Atoms, quoted strings and literals become bytes, NIL becomes None.
+    """
+    stack = [[]]
+    while True:
+        match = _TOKEN_RE.match(data, pos)
+        if not match:
+            return stack[0]
+        pos = match.end()
+        start, end, quoted, literal, atom = match.groups()
+        if start:
+            stack.append([])
+            stack[-2].append(stack[-1])
+        elif end:
+            if len(stack) > 1:
+                stack.pop()
+        elif quoted is not None:
+            stack[-1].append(_ESCAPE_RE.sub(rb'\1', quoted) if b'\\' in quoted else quoted)
+        elif literal:
+            size = int(literal)
+            stack[-1].append(data[pos:pos + size])
+            pos += size
+        else:
+            stack[-1].append(None if atom.upper() == b'NIL' else atom)
+
+
+def rejoin_response(data):
+    """Rebuild the wire bytes that imaplib split around literals"""
+    parts = []
+    for item in data:
+        if isinstance(item, tuple):
+            parts += [item[0], b'\r\n', item[1]]
+        elif item:
+            parts += [item, b'\r\n']
+    return b''.join(parts)
+
+
+def fetch_item_dict(entry):
+    """Turn a parsed FETCH list (UID 5 ENVELOPE (...) ...) into {b'UID': b'5', ...}"""
+    return {key.upper(): value for key, value in zip(entry[::2], entry[1::2]) if isinstance(key, bytes)}
+
+
+def parse_fetch_items(data):
+    """Yield a {name: value} dict per message of an imaplib FETCH response"""
+    for item in parse_sexp(rejoin_response(data)):
+        if isinstance(item, list):
+            yield fetch_item_dict(item)
+
+
+def decode_name(raw):
+    """Decode a display name that may contain RFC 2047 encoded words"""
+    text = raw.decode('utf-8', errors='ignore')
+    if '=?' not in text:
+        return text
+    try:
+        return str(make_header(decode_header(text)))
+    except Exception:
+        return text
+
+
+def envelope_recipients(envelope):
+    """Return (date, [(address, name), ...]) for To/Cc/Bcc of an ENVELOPE"""
+    date = envelope[0].decode('ascii', errors='ignore') if envelope[0] else ''
+    recipients = []
+    for address_list in envelope[5:8]:
+        for address in address_list or []:
+            name, _, mailbox, host = address
+            # Group syntax shows up as entries without a host; skip the markers
+            if not mailbox or not host:
+                continue
+            email_addr = (mailbox + b'@' + host).decode('utf-8', errors='ignore').lower()
+            recipients.append((email_addr, decode_name(name) if name else ''))
+    return date, recipients
+
+
+def message_from_items(items, strategy='headers'):
+    """Return (uid, internaldate, payload) from one parsed FETCH item dict, or None"""
+    if b'UID' not in items:
+        return None
+    if strategy == 'envelope':
+        payload = items.get(b'ENVELOPE')
+        if not isinstance(payload, list) or len(payload) < 8:
+            return None
+    else:
+        payload = next((value for key, value in items.items() if key.startswith(b'BODY[')), None)
+        if not isinstance(payload, bytes):
+            return None
+    internaldate = (items.get(b'INTERNALDATE') or b'').decode('ascii', errors='ignore')
+    return int(items[b'UID']), internaldate, payload
+
+
+def fetch_envelopes(imap, plan, batch_size=BATCH_SIZE, progress=None):
+    """Fetch ENVELOPEs for a FetchPlan or UID list, yielding (uid, internaldate, envelope)"""
+    if not isinstance(plan, FetchPlan):
+        plan = FetchPlan(plan)
+    for msg_set in controlled_batches(plan.batches(batch_size), progress):
+        typ, data = imap.uid('FETCH', msg_set, ENVELOPE_ITEMS)
+        if typ != 'OK':
+            raise imaplib.IMAP4.error(f"UID FETCH failed: {data}")
+        if progress:
+            progress.received(response_size(data))
+        for items in parse_fetch_items(data):
+            message = message_from_items(items, 'envelope')
+            if message:
+                yield message
@@ -16,13 +16,18 @@ from collections import defaultdict
 import ssl
 import sys
 import os
-from datetime import datetime
+import time
+
+from gmail_autocomplete_events import EventChannel, append_log, clear_log, dispatch
+from gmail_autocomplete_fetch import fetch_headers, plan_fetch
+from gmail_autocomplete_progress import REFRESH_MS, ScanProgress, format_progress, percent_done
+from gmail_autocomplete_views import LIVE_REFRESH_SECONDS, ContactBrowser, LiveContactsView, top_contacts
 
 class GmailAutocompleteGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("Gmail to Outlook Autocomplete Builder")
-        self.root.geometry("600x550")
+        self.root.geometry("600x760")
         
         # Set icon if bundled with PyInstaller
         try:
@@ -36,8 +41,14 @@ class GmailAutocompleteGUI:
         self.email_addresses = defaultdict(lambda: {'count': 0, 'name': '', 'last_used': None})
         self.imap = None
         self.processing = False
+        # The scan thread never touches widgets; it posts to this channel instead
+        self.events = EventChannel()
+        # Filled in by the fetch engine and the scan loop, drawn by refresh_progress
+        self.scan_progress = ScanProgress()
+        self.browser = None
         
         self.setup_ui()
+        self.events.attach(self.root, self.handle_events)
         
     def setup_ui(self):
         # Main frame
@@ -88,20 +99,47 @@ class GmailAutocompleteGUI:
         output_entry.pack(side=tk.LEFT)
         browse_btn = ttk.Button(output_frame, text="Browse...", command=self.browse_output)
         browse_btn.pack(side=tk.LEFT, padx=5)
+        # Open the contact browser when the scan ends and export from there, after pruning
+        self.review_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(output_frame, text="Review before export", variable=self.review_var).pack(side=tk.LEFT)
         
         # Process button
-        self.process_btn = ttk.Button(main_frame, text="Start Processing", 
+        button_frame = ttk.Frame(main_frame)
+        button_frame.grid(row=7, column=0, columnspan=2, pady=20)
+        self.process_btn = ttk.Button(button_frame, text="Start Processing", 
                                      command=self.start_processing, width=20)
-        self.process_btn.grid(row=7, column=0, columnspan=2, pady=20)
+        self.process_btn.pack(side=tk.LEFT)
+        
+        # Pause and cancel take effect between fetch batches
+        self.pause_btn = ttk.Button(button_frame, text="Pause", command=self.toggle_pause,
+                                    state=tk.DISABLED, width=10)
+        self.pause_btn.pack(side=tk.LEFT, padx=5)
+        self.cancel_btn = ttk.Button(button_frame, text="Cancel", command=self.cancel_processing,
+                                     state=tk.DISABLED, width=10)
+        self.cancel_btn.pack(side=tk.LEFT)
+        
+        # Review and prune the contacts of the last scan, then export them from the browser
+        self.browse_btn = ttk.Button(button_frame, text="Browse Contacts...", command=self.browse_contacts,
+                                     state=tk.DISABLED)
+        self.browse_btn.pack(side=tk.LEFT, padx=(5, 0))
         
         # Progress bar
-        self.progress = ttk.Progressbar(main_frame, length=400, mode='indeterminate')
+        self.progress = ttk.Progressbar(main_frame, length=400, mode='determinate', maximum=100)
         self.progress.grid(row=8, column=0, columnspan=2, pady=5)
         
+        # Throughput and ETA
+        self.stats_var = tk.StringVar()
+        ttk.Label(main_frame, textvariable=self.stats_var, font=('Arial', 9)).grid(row=9, column=0, columnspan=2)
+        
+        # Top contacts so far, refreshed while scanning
+        results_frame = ttk.LabelFrame(main_frame, text="Top Contacts", padding="5")
+        results_frame.grid(row=10, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(10, 0))
+        self.live_view = LiveContactsView(results_frame)
+        
         # Status text
-        self.status_text = scrolledtext.ScrolledText(main_frame, height=10, width=70, 
+        self.status_text = scrolledtext.ScrolledText(main_frame, height=8, width=70, 
                                                      state=tk.DISABLED, wrap=tk.WORD)
-        self.status_text.grid(row=9, column=0, columnspan=2, pady=10)
+        self.status_text.grid(row=11, column=0, columnspan=2, pady=10)
         
         # Configure grid weights
         self.root.columnconfigure(0, weight=1)
@@ -150,21 +188,14 @@ Settings → Forwarding and POP/IMAP → Enable IMAP"""
             self.output_var.set(filename)
     
     def log_message(self, message, level="info"):
-        self.status_text.config(state=tk.NORMAL)
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        
-        if level == "error":
-            self.status_text.insert(tk.END, f"[{timestamp}] ✗ {message}\n", "error")
-            self.status_text.tag_config("error", foreground="red")
-        elif level == "success":
-            self.status_text.insert(tk.END, f"[{timestamp}] ✓ {message}\n", "success")
-            self.status_text.tag_config("success", foreground="green")
-        else:
-            self.status_text.insert(tk.END, f"[{timestamp}] {message}\n")
-        
-        self.status_text.see(tk.END)
-        self.status_text.config(state=tk.DISABLED)
-        self.root.update_idletasks()
+        self.events.log(message, level)
+    
+    def handle_events(self, events):
+        dispatch(events, lambda lines: append_log(self.status_text, lines), self.apply_updates)
+    
+    def apply_updates(self, latest):
+        if 'top' in latest:
+            self.live_view.update(*latest['top'])
     
     def start_processing(self):
         if self.processing:
@@ -180,14 +211,29 @@ Settings → Forwarding and POP/IMAP → Enable IMAP"""
             return
         
         # Clear status
-        self.status_text.config(state=tk.NORMAL)
-        self.status_text.delete(1.0, tk.END)
-        self.status_text.config(state=tk.DISABLED)
+        clear_log(self.status_text)
+        
+        # Read the form here; Tk variables belong to the main thread
+        self.account = self.email_var.get()
+        self.app_password = self.password_var.get()
+        self.max_messages = self.messages_var.get()
+        self.output_file = self.output_var.get()
+        self.review_first = self.review_var.get()
         
         # Start processing in thread
         self.processing = True
         self.process_btn.config(state=tk.DISABLED, text="Processing...")
-        self.progress.start(10)
+        self.pause_btn.config(state=tk.NORMAL, text="Pause")
+        self.cancel_btn.config(state=tk.NORMAL)
+        self.browse_btn.config(state=tk.DISABLED)
+        # The scan thread is about to change the contacts an open browser shows
+        if self.browser:
+            self.browser.close()
+            self.browser = None
+        # A fresh model per scan, so an earlier cancel does not carry over
+        self.scan_progress = ScanProgress()
+        self.stats_var.set('')
+        self.refresh_progress()
         
         thread = threading.Thread(target=self.process_emails)
         thread.daemon = True
@@ -205,6 +251,20 @@ Settings → Forwarding and POP/IMAP → Enable IMAP"""
             if not self.scan_sent_folder():
                 return
             
+            # Cancelled: keep what was found and let the user decide whether to export it
+            if self.scan_progress.cancelled:
+                snapshot = self.scan_progress.snapshot()
+                self.log_message(f"Scan cancelled after {snapshot.done}/{snapshot.total} messages")
+                self.events.call(self.offer_partial_export)
+                return
+            
+            # Review first: nothing is written until the browser's Export CSV
+            if self.review_first:
+                self.log_message(f"Found {len(self.email_addresses)} contacts; remove any you do not want, "
+                                 f"then click Export CSV", "success")
+                self.events.call(self.open_browser)
+                return
+            
             # Export
             self.log_message("Exporting to CSV...")
             output_file = self.export_to_csv()
@@ -214,24 +274,96 @@ Settings → Forwarding and POP/IMAP → Enable IMAP"""
             self.log_message(f"Output file: {output_file}", "success")
             
             # Show import instructions
-            self.show_import_instructions(output_file)
+            self.events.call(self.show_import_instructions, output_file)
             
         except Exception as e:
             self.log_message(f"Error: {str(e)}", "error")
-            messagebox.showerror("Error", f"Processing failed: {str(e)}")
+            self.events.call(messagebox.showerror, "Error", f"Processing failed: {str(e)}")
         
         finally:
             self.disconnect_gmail()
-            self.processing = False
-            self.progress.stop()
-            self.process_btn.config(state=tk.NORMAL, text="Start Processing")
+            self.events.call(self.finish_processing)
+    
+    def refresh_progress(self):
+        snapshot = self.scan_progress.snapshot()
+        self.progress['value'] = percent_done(snapshot)
+        if snapshot.total:
+            paused = "Paused - " if self.scan_progress.paused else ""
+            self.stats_var.set(paused + format_progress(snapshot))
+        if self.processing:
+            self.root.after(REFRESH_MS, self.refresh_progress)
+    
+    def finish_processing(self):
+        self.processing = False
+        self.refresh_progress()
+        self.process_btn.config(state=tk.NORMAL, text="Start Processing")
+        self.pause_btn.config(state=tk.DISABLED, text="Pause")
+        self.cancel_btn.config(state=tk.DISABLED)
+        self.browse_btn.config(state=tk.NORMAL if self.email_addresses else tk.DISABLED)
+    
+    def toggle_pause(self):
+        if self.scan_progress.paused:
+            self.scan_progress.resume()
+            self.pause_btn.config(text="Pause")
+            self.log_message("Resumed")
+        else:
+            self.scan_progress.pause()
+            self.pause_btn.config(text="Resume")
+            self.log_message("Pausing after the current batch...")
+    
+    def cancel_processing(self):
+        self.scan_progress.cancel()
+        self.pause_btn.config(state=tk.DISABLED, text="Pause")
+        self.cancel_btn.config(state=tk.DISABLED)
+        self.log_message("Cancelling after the current batch...")
+    
+    def browse_contacts(self):
+        if self.processing or not self.email_addresses:
+            return
+        self.open_browser()
+    
+    def open_browser(self):
+        if self.browser:
+            self.browser.close()
+        self.browser = ContactBrowser(self.root, self.email_addresses, on_export=self.export_contacts)
+    
+    def export_contacts(self):
+        try:
+            output_file = self.export_to_csv()
+        except Exception as e:
+            messagebox.showerror("Error", f"Export failed: {str(e)}")
+            return
+        self.log_message(f"Exported {len(self.email_addresses)} contacts to {output_file}", "success")
+        messagebox.showinfo("Export Complete", f"Exported {len(self.email_addresses)} contacts to:\n{os.path.abspath(output_file)}")
+    
+    def offer_partial_export(self):
+        if not self.email_addresses:
+            self.log_message("No contacts found before the scan was cancelled")
+            return
+        count = len(self.email_addresses)
+        # Partial results go next to the output, so the last full export survives
+        root, ext = os.path.splitext(self.output_file)
+        partial_file = f"{root}_partial{ext or '.csv'}"
+        if not messagebox.askyesno("Scan Cancelled", f"Export the {count} contacts found so far to "
+                                   f"{os.path.basename(partial_file)}?"):
+            self.log_message(f"Kept {count} contacts; nothing exported")
+            return
+        try:
+            output_file = self.export_to_csv(partial_file)
+        except Exception as e:
+            self.log_message(f"Error: {str(e)}", "error")
+            messagebox.showerror("Error", f"Export failed: {str(e)}")
+            return
+        self.log_message(f"Exported {count} contacts from the cancelled scan", "success")
+        self.log_message(f"Output file: {output_file}", "success")
+        self.show_import_instructions(output_file)
     
     def connect_gmail(self):
         try:
             context = ssl.create_default_context()
             self.imap = imaplib.IMAP4_SSL('imap.gmail.com', 993, ssl_context=context)
-            self.imap.login(self.email_var.get(), self.password_var.get())
-            self.log_message(f"Connected to {self.email_var.get()}", "success")
+            self.imap.login(self.account, self.app_password)
+            self.log_message(f"Connected to {self.account}", "success")
             return True
         except Exception as e:
             self.log_message(f"Connection failed: {str(e)}", "error")
@@ -240,7 +372,7 @@ Settings → Forwarding and POP/IMAP → Enable IMAP"""
     
     def scan_sent_folder(self):
         try:
-            max_messages = int(self.messages_var.get())
+            max_messages = int(self.max_messages)
             
             # Find sent folder
             sent_folders = ['[Gmail]/Sent Mail', 'Sent', 'INBOX.Sent', '[Gmail]/Sent']
@@ -248,7 +380,8 @@ Settings → Forwarding and POP/IMAP → Enable IMAP"""
             
             for folder in sent_folders:
                 try:
-                    self.imap.select(f'"{folder}"', readonly=True)
+                    _, data = self.imap.select(f'"{folder}"', readonly=True)
+                    exists = int(data[0])
                     folder_found = True
                     self.log_message(f"Found sent folder: {folder}")
                     break
@@ -259,24 +392,25 @@ Settings → Forwarding and POP/IMAP → Enable IMAP"""
                 self.log_message("Could not find sent folder", "error")
                 return False
             
-            # Search messages
-            _, message_ids = self.imap.search(None, 'ALL')
-            message_ids = message_ids[0].split()
-            
-            # Limit messages
-            message_ids = message_ids[-max_messages:] if len(message_ids) > max_messages else message_ids
-            total = len(message_ids)
+            # Plan the newest UIDs to fetch (UID ranges when the server supports ESEARCH)
+            plan = plan_fetch(self.imap, max_messages, exists)
+            total = len(plan)
             
             self.log_message(f"Processing {total} messages...")
+            self.scan_progress.start(total)
             
-            for idx, msg_id in enumerate(message_ids, 1):
-                if idx % 50 == 0:
-                    self.log_message(f"Processed {idx}/{total} messages...")
+            # Fetch recipient headers in batches
+            next_snapshot = time.monotonic() + LIVE_REFRESH_SECONDS
+            for uid, internaldate, header_bytes in fetch_headers(self.imap, plan, progress=self.scan_progress):
+                self.scan_progress.advance()
+                
+                # This thread owns email_addresses, so it takes the snapshots for the live table
+                if time.monotonic() >= next_snapshot:
+                    self.events.post('top', top_contacts(self.email_addresses))
+                    next_snapshot = time.monotonic() + LIVE_REFRESH_SECONDS
                 
                 try:
-                    _, msg_data = self.imap.fetch(msg_id, '(RFC822)')
-                    raw_email = msg_data[0][1]
-                    msg = email.message_from_bytes(raw_email)
+                    msg = email.message_from_bytes(header_bytes)
                     
                     # Process recipients
                     for field in ['To', 'Cc', 'Bcc']:
@@ -290,6 +424,7 @@ Settings → Forwarding and POP/IMAP → Enable IMAP"""
                 except:
                     continue
             
+            self.events.post('top', top_contacts(self.email_addresses))
             self.log_message(f"Found {len(self.email_addresses)} unique email addresses", "success")
             return True
             
@@ -329,13 +464,13 @@ Settings → Forwarding and POP/IMAP → Enable IMAP"""
                 if matches:
                     email_addr = matches[0]
             
-            if email_addr and email_addr.lower() != self.email_var.get().lower():
+            if email_addr and email_addr.lower() != self.account.lower():
                 addresses.append((email_addr.lower(), name))
         
         return addresses
     
-    def export_to_csv(self):
-        filename = self.output_var.get()
+    def export_to_csv(self, filename=None):
+        filename = filename or self.output_file
         
         sorted_addresses = sorted(self.email_addresses.items(), 
                                  key=lambda x: x[1]['count'], 
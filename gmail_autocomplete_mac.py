@@ -16,10 +16,15 @@ from collections import defaultdict
 import ssl
 import sys
 import os
+import time
 import subprocess
-from datetime import datetime
 import platform
 
+from gmail_autocomplete_events import EventChannel, append_log, clear_log, dispatch
+from gmail_autocomplete_fetch import fetch_headers, plan_fetch
+from gmail_autocomplete_progress import REFRESH_MS, ScanProgress, format_progress, percent_done
+from gmail_autocomplete_views import LIVE_REFRESH_SECONDS, ContactBrowser, LiveContactsView, top_contacts
+
 class GmailAutocompleteMac:
     def __init__(self, root):
         self.root = root
@@ -27,7 +32,7 @@ class GmailAutocompleteMac:
         
         # Set window size and center it
         window_width = 650
-        window_height = 600
+        window_height = 800
         screen_width = root.winfo_screenwidth()
         screen_height = root.winfo_screenheight()
         x = (screen_width - window_width) // 2
@@ -40,9 +45,15 @@ class GmailAutocompleteMac:
         self.email_addresses = defaultdict(lambda: {'count': 0, 'name': '', 'last_used': None})
         self.imap = None
         self.processing = False
+        # The scan thread never touches widgets; it posts to this channel instead
+        self.events = EventChannel()
+        # Filled in by the fetch engine and the scan loop, drawn by refresh_progress
+        self.scan_progress = ScanProgress()
+        self.browser = None
         
         self.setup_ui()
         self.setup_mac_menu()
+        self.events.attach(self.root, self.handle_events)
         
     def setup_mac_style(self):
         """Configure macOS-specific styling"""
@@ -82,6 +93,7 @@ class GmailAutocompleteMac:
         file_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label='File', menu=file_menu)
         file_menu.add_command(label='Export CSV...', command=self.export_csv, accelerator='⌘E')
+        file_menu.add_command(label='Browse Contacts...', command=self.browse_contacts, accelerator='⌘B')
         file_menu.add_command(label='Import to Outlook...', command=self.show_import_instructions)
         
         if platform.system() != 'Darwin':
@@ -96,6 +108,7 @@ class GmailAutocompleteMac:
         
         # Bind keyboard shortcuts
         self.root.bind('<Command-e>', lambda e: self.export_csv())
+        self.root.bind('<Command-b>', lambda e: self.browse_contacts())
         
     def setup_ui(self):
         # Main container with padding
@@ -162,18 +175,47 @@ class GmailAutocompleteMac:
         browse_btn = ttk.Button(output_frame, text="Browse", command=self.browse_output)
         browse_btn.grid(row=0, column=1, padx=(5, 0))
         
+        # Open the contact browser when the scan ends and export from there, after pruning
+        self.review_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(settings_frame, text="Review contacts before export",
+                        variable=self.review_var).grid(row=2, column=1, sticky=tk.W, pady=(5, 0), padx=(10, 0))
+        
         # Process button
-        self.process_btn = ttk.Button(main_frame, text="Scan Gmail & Create CSV", 
+        button_frame = ttk.Frame(main_frame)
+        button_frame.grid(row=4, column=0, columnspan=2, pady=20)
+        self.process_btn = ttk.Button(button_frame, text="Scan Gmail & Create CSV", 
                                      command=self.start_processing)
-        self.process_btn.grid(row=4, column=0, columnspan=2, pady=20)
+        self.process_btn.grid(row=0, column=0)
+        
+        # Pause and cancel take effect between fetch batches
+        self.pause_btn = ttk.Button(button_frame, text="Pause", command=self.toggle_pause, state=tk.DISABLED)
+        self.pause_btn.grid(row=0, column=1, padx=(10, 0))
+        self.cancel_btn = ttk.Button(button_frame, text="Cancel", command=self.cancel_processing, state=tk.DISABLED)
+        self.cancel_btn.grid(row=0, column=2, padx=(5, 0))
+        
+        # Review and prune the contacts of the last scan, then export them from the browser
+        self.browse_btn = ttk.Button(button_frame, text="Browse Contacts...", command=self.browse_contacts,
+                                     state=tk.DISABLED)
+        self.browse_btn.grid(row=0, column=3, padx=(5, 0))
         
         # Progress bar
-        self.progress = ttk.Progressbar(main_frame, length=400, mode='indeterminate')
-        self.progress.grid(row=5, column=0, columnspan=2, pady=(0, 10))
+        self.progress = ttk.Progressbar(main_frame, length=400, mode='determinate', maximum=100)
+        self.progress.grid(row=5, column=0, columnspan=2, pady=(0, 5))
+        
+        # Throughput and ETA
+        self.stats_var = tk.StringVar()
+        stats_label = ttk.Label(main_frame, textvariable=self.stats_var, font=('-apple-system', 11),
+                                foreground='gray')
+        stats_label.grid(row=6, column=0, columnspan=2, pady=(0, 10))
+        
+        # Top contacts so far, refreshed while scanning
+        results_frame = ttk.LabelFrame(main_frame, text="Top Contacts", padding="5")
+        results_frame.grid(row=7, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 10))
+        self.live_view = LiveContactsView(results_frame)
         
         # Status text with frame
         status_frame = ttk.LabelFrame(main_frame, text="Status", padding="5")
-        status_frame.grid(row=6, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 10))
+        status_frame.grid(row=8, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 10))
         status_frame.columnconfigure(0, weight=1)
         status_frame.rowconfigure(0, weight=1)
         
@@ -183,7 +225,8 @@ class GmailAutocompleteMac:
         self.status_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         
         # Configure grid weights for resizing
-        main_frame.rowconfigure(6, weight=1)
+        main_frame.rowconfigure(7, weight=1)
+        main_frame.rowconfigure(8, weight=1)
         
     def show_about(self):
         """Show about dialog"""
@@ -324,22 +367,17 @@ Troubleshooting:
             messagebox.showinfo("Export Complete", f"Exported to:\n{filename}")
     
     def log_message(self, message, level="info"):
-        """Log message to status text"""
-        self.status_text.config(state=tk.NORMAL)
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        
-        if level == "error":
-            self.status_text.insert(tk.END, f"[{timestamp}] ✗ {message}\n", "error")
-            self.status_text.tag_config("error", foreground="red")
-        elif level == "success":
-            self.status_text.insert(tk.END, f"[{timestamp}] ✓ {message}\n", "success")
-            self.status_text.tag_config("success", foreground="green")
-        else:
-            self.status_text.insert(tk.END, f"[{timestamp}] {message}\n")
-        
-        self.status_text.see(tk.END)
-        self.status_text.config(state=tk.DISABLED)
-        self.root.update_idletasks()
+        """Queue a status line; safe to call from the scan thread"""
+        self.events.log(message, level)
+    
+    def handle_events(self, events):
+        """Apply one frame of queued events on the Tk thread"""
+        dispatch(events, lambda lines: append_log(self.status_text, lines), self.apply_updates)
+    
+    def apply_updates(self, latest):
+        """Show the newest snapshot of each kind posted during the frame"""
+        if 'top' in latest:
+            self.live_view.update(*latest['top'])
     
     def start_processing(self):
         """Start processing emails"""
@@ -356,14 +394,29 @@ Troubleshooting:
             return
         
         # Clear status
-        self.status_text.config(state=tk.NORMAL)
-        self.status_text.delete(1.0, tk.END)
-        self.status_text.config(state=tk.DISABLED)
+        clear_log(self.status_text)
+        
+        # Read the form here; Tk variables belong to the main thread
+        self.account = self.email_var.get()
+        self.app_password = self.password_var.get()
+        self.max_messages = self.messages_var.get()
+        self.output_file = os.path.expanduser(self.output_var.get())
+        self.review_first = self.review_var.get()
         
         # Start processing
         self.processing = True
         self.process_btn.config(state=tk.DISABLED, text="Processing...")
-        self.progress.start(10)
+        self.pause_btn.config(state=tk.NORMAL, text="Pause")
+        self.cancel_btn.config(state=tk.NORMAL)
+        self.browse_btn.config(state=tk.DISABLED)
+        # The scan thread is about to change the contacts an open browser shows
+        if self.browser:
+            self.browser.close()
+            self.browser = None
+        # A fresh model per scan, so an earlier cancel does not carry over
+        self.scan_progress = ScanProgress()
+        self.stats_var.set('')
+        self.refresh_progress()
         
         # Run in thread
         thread = threading.Thread(target=self.process_emails)
@@ -383,8 +436,22 @@ Troubleshooting:
             if not self.scan_sent_folder():
                 return
             
+            # Cancelled: keep what was found and let the user decide whether to export it
+            if self.scan_progress.cancelled:
+                snapshot = self.scan_progress.snapshot()
+                self.log_message(f"Scan cancelled after {snapshot.done}/{snapshot.total} messages")
+                self.events.call(self.offer_partial_export)
+                return
+            
+            # Review first: nothing is written until the browser's Export CSV
+            if self.review_first:
+                self.log_message(f"Found {len(self.email_addresses)} contacts; remove any you do not want, "
+                                 f"then click Export CSV", "success")
+                self.events.call(self.open_browser)
+                return
+            
             # Export
-            output_file = os.path.expanduser(self.output_var.get())
+            output_file = self.output_file
             self.log_message(f"Exporting to {output_file}...")
             self.export_to_csv(output_file)
             
@@ -393,25 +460,95 @@ Troubleshooting:
             self.log_message(f"File saved to: {output_file}", "success")
             
             # Show import instructions
-            self.root.after(100, lambda: self.show_import_instructions(output_file))
+            self.events.call(self.show_import_instructions, output_file)
             
         except Exception as e:
             self.log_message(f"Error: {str(e)}", "error")
-            self.root.after(100, lambda: messagebox.showerror("Error", f"Processing failed: {str(e)}"))
+            self.events.call(messagebox.showerror, "Error", f"Processing failed: {str(e)}")
         
         finally:
             self.disconnect_gmail()
-            self.processing = False
-            self.progress.stop()
-            self.process_btn.config(state=tk.NORMAL, text="Scan Gmail & Create CSV")
+            self.events.call(self.finish_processing)
+    
+    def refresh_progress(self):
+        """Redraw the progress bar and stats line while a scan runs"""
+        snapshot = self.scan_progress.snapshot()
+        self.progress['value'] = percent_done(snapshot)
+        if snapshot.total:
+            paused = "Paused - " if self.scan_progress.paused else ""
+            self.stats_var.set(paused + format_progress(snapshot))
+        if self.processing:
+            self.root.after(REFRESH_MS, self.refresh_progress)
+    
+    def finish_processing(self):
+        """Reset the controls once the scan thread is done"""
+        self.processing = False
+        self.refresh_progress()
+        self.process_btn.config(state=tk.NORMAL, text="Scan Gmail & Create CSV")
+        self.pause_btn.config(state=tk.DISABLED, text="Pause")
+        self.cancel_btn.config(state=tk.DISABLED)
+        self.browse_btn.config(state=tk.NORMAL if self.email_addresses else tk.DISABLED)
+    
+    def toggle_pause(self):
+        """Pause the scan before its next batch, or resume it"""
+        if self.scan_progress.paused:
+            self.scan_progress.resume()
+            self.pause_btn.config(text="Pause")
+            self.log_message("Resumed")
+        else:
+            self.scan_progress.pause()
+            self.pause_btn.config(text="Resume")
+            self.log_message("Pausing after the current batch...")
+    
+    def cancel_processing(self):
+        """Stop the scan before its next batch, keeping the contacts found so far"""
+        self.scan_progress.cancel()
+        self.pause_btn.config(state=tk.DISABLED, text="Pause")
+        self.cancel_btn.config(state=tk.DISABLED)
+        self.log_message("Cancelling after the current batch...")
+    
+    def browse_contacts(self):
+        """Open the contact browser on the results of the last scan"""
+        if self.processing or not self.email_addresses:
+            return
+        self.open_browser()
+    
+    def open_browser(self):
+        """Show the contacts in a fresh contact browser, closing any open one"""
+        if self.browser:
+            self.browser.close()
+        self.browser = ContactBrowser(self.root, self.email_addresses, on_export=self.export_csv)
+    
+    def offer_partial_export(self):
+        """Ask whether to export the contacts of a cancelled scan"""
+        if not self.email_addresses:
+            self.log_message("No contacts found before the scan was cancelled")
+            return
+        count = len(self.email_addresses)
+        # Partial results go next to the output, so the last full export survives
+        root, ext = os.path.splitext(self.output_file)
+        partial_file = f"{root}_partial{ext or '.csv'}"
+        if not messagebox.askyesno("Scan Cancelled", f"Export the {count} contacts found so far to "
+                                   f"{os.path.basename(partial_file)}?"):
+            self.log_message(f"Kept {count} contacts; nothing exported")
+            return
+        try:
+            output_file = self.export_to_csv(partial_file)
+        except Exception as e:
+            self.log_message(f"Error: {str(e)}", "error")
+            messagebox.showerror("Error", f"Export failed: {str(e)}")
+            return
+        self.log_message(f"Exported {count} contacts from the cancelled scan", "success")
+        self.log_message(f"File saved to: {output_file}", "success")
+        self.show_import_instructions(output_file)
     
     def connect_gmail(self):
         """Connect to Gmail via IMAP"""
         try:
             context = ssl.create_default_context()
             self.imap = imaplib.IMAP4_SSL('imap.gmail.com', 993, ssl_context=context)
-            self.imap.login(self.email_var.get(), self.password_var.get())
-            self.log_message(f"Connected to {self.email_var.get()}", "success")
+            self.imap.login(self.account, self.app_password)
+            self.log_message(f"Connected to {self.account}", "success")
             return True
         except Exception as e:
             self.log_message(f"Connection failed: {str(e)}", "error")
@@ -420,7 +557,7 @@ Troubleshooting:
     def scan_sent_folder(self):
         """Scan Gmail sent folder"""
         try:
-            max_messages = int(self.messages_var.get())
+            max_messages = int(self.max_messages)
             
             # Find sent folder
             sent_folders = ['[Gmail]/Sent Mail', 'Sent', 'INBOX.Sent']
@@ -428,7 +565,8 @@ Troubleshooting:
             
             for folder in sent_folders:
                 try:
-                    self.imap.select(f'"{folder}"', readonly=True)
+                    _, data = self.imap.select(f'"{folder}"', readonly=True)
+                    exists = int(data[0])
                     folder_found = True
                     self.log_message(f"Found sent folder: {folder}")
                     break
@@ -439,25 +577,25 @@ Troubleshooting:
                 self.log_message("Could not find sent folder", "error")
                 return False
             
-            # Get messages
-            _, message_ids = self.imap.search(None, 'ALL')
-            message_ids = message_ids[0].split()
-            
-            # Limit messages
-            message_ids = message_ids[-max_messages:] if len(message_ids) > max_messages else message_ids
-            total = len(message_ids)
+            # Plan the newest UIDs to fetch (UID ranges when the server supports ESEARCH)
+            plan = plan_fetch(self.imap, max_messages, exists)
+            total = len(plan)
             
             self.log_message(f"Processing {total} messages...")
+            self.scan_progress.start(total)
             
-            # Process messages
-            for idx, msg_id in enumerate(message_ids, 1):
-                if idx % 50 == 0:
-                    self.log_message(f"Processed {idx}/{total} messages...")
+            # Fetch recipient headers in batches
+            next_snapshot = time.monotonic() + LIVE_REFRESH_SECONDS
+            for uid, internaldate, header_bytes in fetch_headers(self.imap, plan, progress=self.scan_progress):
+                self.scan_progress.advance()
+                
+                # This thread owns email_addresses, so it takes the snapshots for the live table
+                if time.monotonic() >= next_snapshot:
+                    self.events.post('top', top_contacts(self.email_addresses))
+                    next_snapshot = time.monotonic() + LIVE_REFRESH_SECONDS
                 
                 try:
-                    _, msg_data = self.imap.fetch(msg_id, '(RFC822)')
-                    raw_email = msg_data[0][1]
-                    msg = email.message_from_bytes(raw_email)
+                    msg = email.message_from_bytes(header_bytes)
                     
                     # Process recipients
                     for field in ['To', 'Cc', 'Bcc']:
@@ -471,6 +609,7 @@ Troubleshooting:
                 except:
                     continue
             
+            self.events.post('top', top_contacts(self.email_addresses))
             self.log_message(f"Found {len(self.email_addresses)} unique addresses", "success")
             return True
             
@@ -511,7 +650,7 @@ Troubleshooting:
                 if matches:
                     email_addr = matches[0]
             
-            if email_addr and email_addr.lower() != self.email_var.get().lower():
+            if email_addr and email_addr.lower() != self.account.lower():
                 addresses.append((email_addr.lower(), name))
         
         return addresses
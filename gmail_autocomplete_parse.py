@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Gmail Autocomplete Builder - Recipient Parsing
+Turns fetched headers or ENVELOPEs into (address, name) pairs, one batch at a time
+"""
+
+import email
+from email.header import decode_header
+from email.utils import mktime_tz, parsedate_tz
+import functools
+import re
+
+from gmail_autocomplete_contacts import HALF_LIFE_DAYS, ContactStore
+from gmail_autocomplete_fetch import envelope_recipients
+
+# A To/Cc/Bcc/Date field with its folded continuation lines; first-line
+# whitespace after the colon is skipped as email.message_from_bytes does
+_FIELD_RE = re.compile(rb'^(to|cc|bcc|date):[ \t]*([^\r\n]*(?:\r?\n[ \t][^\r\n]*)*)', re.IGNORECASE | re.MULTILINE)
+_FOLD_RE = re.compile(rb'\r?\n(?=[ \t])')
+_HEADER_END_RE = re.compile(rb'\r?\n\r?\n')
+
+# Distinct raw header values whose decoded text is kept
+DECODE_CACHE_SIZE = 4096
+
+# Characters that would split a decoded display name when tokenizing
+_SPECIALS_RE = re.compile(r'[,;:"<>]')
+
+# Address tokenizing: quoted names, backslash escapes inside them, bare addresses
+_QUOTED_STRING_RE = re.compile(r'"(?:[^"\\]|\\.)*"')
+_QUOTED_PAIR_RE = re.compile(r'\\(.)')
+_EMAIL_RE = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+
+
+def decode_recipients(recipients):
+    """Decode every RFC 2047 encoded word of a recipient header to text
+
+    Decoded names holding commas, quotes or angle brackets are re-quoted so
+    they still tokenize as one display name.
+    """
+    if '=?' not in recipients:
+        return recipients
+    
+    parts = []
+    for chunk, charset in decode_header(recipients):
+        if charset is None:
+            # Text between encoded words, as decode_header encoded it
+            parts.append(chunk.decode('raw-unicode-escape'))
+            continue
+        try:
+            text = chunk.decode(charset, errors='replace')
+        except LookupError:
+            text = chunk.decode('utf-8', errors='replace')
+        if _SPECIALS_RE.search(text):
+            text = '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+        parts.append(text)
+    return ''.join(parts)
+
+
+@functools.lru_cache(maxsize=DECODE_CACHE_SIZE)
+def decode_header_bytes(raw):
+    """decode_recipients for a raw header value, memoized on its bytes
+
+    The same recipient lists recur thousands of times in a sent folder, so
+    repeats cost a dict lookup; decode_header_bytes.cache_info() has the
+    hit and miss counts.
+    """
+    return decode_recipients(raw.decode('utf-8', errors='replace'))
+
+
+def decode_cache_stats(worker_counts=None):
+    """One-line hit-rate summary of the header decoding cache, or None if unused
+
+    worker_counts, (hits, misses) pairs returned by count_batch, summarizes
+    the caches of worker processes instead of this process's.
+    """
+    if worker_counts is None:
+        info = decode_header_bytes.cache_info()
+        hits, misses, cached = info.hits, info.misses, f"{info.currsize}/{info.maxsize} cached"
+    else:
+        hits, misses = sum(counts[0] for counts in worker_counts), sum(counts[1] for counts in worker_counts)
+        cached = "across worker processes"
+    lookups = hits + misses
+    if not lookups:
+        return None
+    return f"{hits / lookups:.0%} hit rate ({hits} hits, {misses} misses, {cached})"
+
+
+def _join_quoted(parts):
+    """Re-join comma-split parts that were inside a quoted display name"""
+    joined = []
+    for part in parts:
+        if joined and (joined[-1].count('"') - joined[-1].count('\\"')) % 2:
+            joined[-1] += ',' + part
+        else:
+            joined.append(part)
+    return joined
+
+
+def _tokenize_part(part, search_email):
+    """(address, name) for one comma-separated part, or None if it holds no address"""
+    # Angle brackets inside a quoted name are part of the name, not the address
+    start = 0
+    if '"' in part:
+        for quoted in _QUOTED_STRING_RE.finditer(part):
+            start = quoted.end()
+    open_angle = part.find('<', start)
+    close_angle = part.find('>', open_angle) if open_angle >= 0 else -1
+    if close_angle < 0:
+        match = search_email(part)
+        return (match.group().lower(), '') if match else None
+    
+    # "Name <address>", possibly after a group name
+    name = part[:open_angle].strip()
+    if ':' in name and not name.startswith('"'):
+        name = name[name.rfind(':') + 1:].strip()
+    if len(name) > 1 and name[0] == name[-1] == '"':
+        # Unquote before unescaping, so an escaped quote at the end survives
+        name = _QUOTED_PAIR_RE.sub(r'\1', name[1:-1])
+    else:
+        name = name.strip('"\'')
+    return part[open_angle + 1:close_angle].strip().lower(), name
+
+
+def tokenize_recipients(header_values, own_address=''):
+    """Split many recipient header values into one [(address, name)] list per value
+
+    Quoted display names may contain commas, group names ("Team: a@x, b@y;")
+    are skipped, and "Name <address>" and bare addresses are both recognized.
+    The same recipients recur across a batch, so each distinct part is only
+    tokenized once per call.
+    """
+    own_address = own_address.lower()
+    search_email = _EMAIL_RE.search
+    seen = {}
+    results = []
+    
+    for value in header_values:
+        parts = value.split(',')
+        if '"' in value:
+            parts = _join_quoted(parts)
+        
+        addresses = []
+        for part in parts:
+            try:
+                recipient = seen[part]
+            except KeyError:
+                recipient = seen[part] = _tokenize_part(part, search_email)
+            if recipient and recipient[0] and recipient[0] != own_address:
+                addresses.append(recipient)
+        results.append(addresses)
+    
+    return results
+
+
+def extract_email_addresses(email_string, own_address=''):
+    """Extract email addresses from various email header formats"""
+    return tokenize_recipients([email_string], own_address)[0]
+
+
+def extract_email_addresses_split(email_string, own_address=''):
+    """The comma-splitting extract_email_addresses, kept as the benchmark baseline"""
+    addresses = []
+    own_address = own_address.lower()
+
+    # Pattern for email addresses
+    email_pattern = r'([a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})'
+
+    # Split by comma for multiple recipients
+    parts = email_string.split(',')
+
+    for part in parts:
+        # Extract name and email
+        name = ''
+        email_addr = ''
+
+        # Check for "Name <email>" format
+        if '<' in part and '>' in part:
+            name_part = part.split('<')[0].strip()
+            email_part = part.split('<')[1].split('>')[0].strip()
+            name = name_part.strip('"\'')
+            email_addr = email_part
+        else:
+            # Just email address
+            matches = re.findall(email_pattern, part)
+            if matches:
+                email_addr = matches[0]
+
+        if email_addr and email_addr.lower() != own_address:
+            addresses.append((email_addr.lower(), name))
+
+    return addresses
+
+
+def header_fields(header_bytes):
+    """Return {b'to': value, ...} for the To/Cc/Bcc/Date fields of raw header bytes
+
+    Scans a memoryview of the headers so only the four fields are copied and
+    no Message object is built. Folded values are unfolded; like
+    email.message_from_bytes, the first occurrence of a field wins.
+    """
+    view = memoryview(header_bytes)
+    end = _HEADER_END_RE.search(view)
+    if end:
+        view = view[:end.start()]
+    
+    fields = {}
+    for match in _FIELD_RE.finditer(view):
+        name = match.group(1).lower()
+        if name not in fields:
+            fields[name] = _FOLD_RE.sub(b'', match.group(2))
+    return fields
+
+
+def parse_header_batch(messages):
+    """Parse stage: (uid, internaldate, header_bytes) -> (date, [recipient header text])"""
+    parsed = []
+    for uid, internaldate, header_bytes in messages:
+        try:
+            fields = header_fields(header_bytes)
+            
+            # INTERNALDATE when the Date header is missing
+            date_str = fields.get(b'date', b'').decode('utf-8', errors='replace') or internaldate
+            values = [decode_header_bytes(fields[field]) for field in (b'to', b'cc', b'bcc') if fields.get(field)]
+            parsed.append((date_str, values))
+        except Exception:
+            continue
+    return parsed
+
+
+def parse_header_batch_email(messages):
+    """parse_header_batch built on email.message_from_bytes, kept as the benchmark baseline"""
+    parsed = []
+    for uid, internaldate, header_bytes in messages:
+        try:
+            msg = email.message_from_bytes(header_bytes)
+
+            # INTERNALDATE when the Date header is missing
+            date_str = msg.get('Date', '') or internaldate
+            values = [decode_recipients(msg[field]) for field in ('To', 'Cc', 'Bcc') if msg.get(field, '')]
+            parsed.append((date_str, values))
+        except Exception:
+            continue
+    return parsed
+
+
+def date_to_epoch(value):
+    """Epoch seconds of an RFC 2822 Date or IMAP INTERNALDATE string, 0 if unparseable"""
+    try:
+        parsed = parsedate_tz(value)
+        return mktime_tz(parsed) if parsed else 0
+    except (TypeError, ValueError, OverflowError):
+        return 0
+
+
+def normalize_header_batch(parsed, own_address=''):
+    """Normalize stage: (date, [header text]) -> (epoch seconds, [(address, name)])"""
+    # One tokenizer pass over every recipient header in the batch
+    recipients = tokenize_recipients([', '.join(values) for date_str, values in parsed], own_address)
+    return [(date_to_epoch(date_str), addresses) for (date_str, values), addresses in zip(parsed, recipients)]
+
+
+def parse_envelope_batch(messages):
+    """Parse stage: (uid, internaldate, envelope) -> (date, [(address, name)])"""
+    parsed = []
+    for uid, internaldate, envelope in messages:
+        try:
+            date_str, addresses = envelope_recipients(envelope)
+            parsed.append((date_str or internaldate, addresses))
+        except Exception:
+            continue
+    return parsed
+
+
+def normalize_envelope_batch(parsed, own_address=''):
+    """Normalize stage: date to epoch seconds, and drop our own address from ENVELOPE recipients"""
+    own_address = own_address.lower()
+    return [(date_to_epoch(date_str), [(email_addr, name) for email_addr, name in addresses if email_addr != own_address])
+            for date_str, addresses in parsed]
+
+
+# Parse and normalize stages for each fetch strategy
+PARSE_STAGES = {
+    'headers': (parse_header_batch, normalize_header_batch),
+    'envelope': (parse_envelope_batch, normalize_envelope_batch),
+}
+
+
+def count_batch(messages, strategy='headers', own_address='', half_life_days=HALF_LIFE_DAYS):
+    """Parse, normalize and count one batch, e.g. in a worker process
+
+    Returns (messages counted, ContactStore, (decode cache hits, misses)) for
+    the main process to merge; the cache counts cover this batch only.
+    """
+    before = decode_header_bytes.cache_info()
+    parse, normalize = PARSE_STAGES[strategy]
+    parsed = normalize(parse(messages), own_address)
+    contacts = ContactStore(half_life_days)
+    for sent, addresses in parsed:
+        contacts.record(addresses, sent)
+    after = decode_header_bytes.cache_info()
+    return len(parsed), contacts, (after.hits - before.hits, after.misses - before.misses)
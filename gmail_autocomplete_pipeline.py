@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Gmail Autocomplete Builder - Streaming Scan Pipeline
+Runs fetch -> parse -> normalize -> aggregate as stages linked by bounded queues
+"""
+
+import multiprocessing
+import queue
+import signal
+import threading
+from collections import deque
+
+# How stages run: in the caller's loop, one thread each, or one process each
+STAGE_MODES = ('inline', 'threads', 'processes')
+
+# Batches buffered between two stages; a full queue blocks the stage before it
+QUEUE_SIZE = 4
+
+# How often blocked stages check whether the pipeline was stopped
+_POLL_SECONDS = 0.1
+
+
+class _Failure:
+    """Carries an exception from a stage to the end of the pipeline"""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def batched(items, size):
+    """Group an iterable into lists of at most size items"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def ignore_interrupts():
+    """Process initializer leaving Ctrl-C to the main process, which cancels the scan and stops its workers"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _put(channel, item, stop):
+    """Put item on a bounded queue, giving up if the pipeline is stopped"""
+    while not stop.is_set():
+        try:
+            channel.put(item, timeout=_POLL_SECONDS)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(channel, stop):
+    """Get the next item from a queue, or None once the pipeline is stopped"""
+    while not stop.is_set():
+        try:
+            return channel.get(timeout=_POLL_SECONDS)
+        except queue.Empty:
+            continue
+    return None
+
+
+def _produce(source, outbox, stop):
+    """First stage: feed the source's batches into the pipeline, then None"""
+    try:
+        for batch in source:
+            if not _put(outbox, batch, stop):
+                return
+        _put(outbox, None, stop)
+    except BaseException as e:
+        _put(outbox, _Failure(e), stop)
+
+
+def _work(stage, inbox, outbox, stop):
+    """Middle stage: apply stage to each batch until None or a failure arrives"""
+    while True:
+        batch = _get(inbox, stop)
+        if batch is None or isinstance(batch, _Failure):
+            _put(outbox, batch, stop)
+            return
+        try:
+            result = stage(batch)
+        except BaseException as e:
+            _put(outbox, _Failure(e), stop)
+            return
+        if not _put(outbox, result, stop):
+            return
+
+
+def _work_process(stage, inbox, outbox, stop):
+    """_work in a stage process, which must survive the Ctrl-C sent to the whole process group"""
+    ignore_interrupts()
+    _work(stage, inbox, outbox, stop)
+
+
+def run_pipeline(source, stages, sink, mode='inline', queue_size=QUEUE_SIZE):
+    """Push every batch from source through stages and hand the results to sink
+
+    sink always runs in the calling thread and sees batches in source order.
+    In 'processes' mode the stages must be picklable module-level callables
+    (functools.partial is fine); the source still runs on a thread here.
+    """
+    if mode == 'inline':
+        for batch in source:
+            for stage in stages:
+                batch = stage(batch)
+            sink(batch)
+        return
+
+    if mode == 'processes':
+        context = multiprocessing.get_context()
+        make_queue, stop = (lambda: context.Queue(queue_size)), context.Event()
+        start_stage = lambda target, args: context.Process(target=target, args=args, daemon=True)
+    else:
+        make_queue, stop = (lambda: queue.Queue(queue_size)), threading.Event()
+        start_stage = lambda target, args: threading.Thread(target=target, args=args, daemon=True)
+
+    channels = [make_queue() for _ in range(len(stages) + 1)]
+    producer = threading.Thread(target=_produce, args=(source, channels[0], stop), daemon=True)
+    target = _work_process if mode == 'processes' else _work
+    workers = [start_stage(target, (stage, channels[i], channels[i + 1], stop)) for i, stage in enumerate(stages)]
+    producer.start()
+    for worker in workers:
+        worker.start()
+
+    try:
+        while True:
+            batch = _get(channels[-1], stop)
+            if batch is None:
+                return
+            if isinstance(batch, _Failure):
+                raise batch.error
+            sink(batch)
+    finally:
+        # Unblocks every stage, whether we finished, failed or were interrupted
+        stop.set()
+        producer.join()
+        for worker in workers:
+            worker.join(timeout=1)
+            if mode == 'processes' and worker.is_alive():
+                worker.terminate()
+        if mode == 'processes':
+            # Don't wait at exit to flush batches nobody will read
+            for channel in channels:
+                channel.cancel_join_thread()
+
+
+def run_pool(source, work, sink, executor, workers):
+    """Run work(batch) on an executor for every batch, handing results to sink in order
+
+    At most two batches per worker are in flight, so a slow sink or slow
+    workers hold up the source instead of piling up memory.
+    """
+    pending = deque()
+    try:
+        for batch in source:
+            pending.append(executor.submit(work, batch))
+            while len(pending) >= 2 * workers or (pending and pending[0].done()):
+                sink(pending.popleft().result())
+        while pending:
+            sink(pending.popleft().result())
+    finally:
+        for future in pending:
+            future.cancel()
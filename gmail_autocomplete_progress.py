@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Gmail Autocomplete Builder - Scan Progress
+Messages done, bytes received, moving-window throughput and ETA of a running scan,
+plus the pause and cancel requests the fetch engines honour between batches
+"""
+
+import threading
+import time
+from collections import deque, namedtuple
+
+# Seconds of history behind the msgs/sec and bytes/sec figures
+WINDOW_SECONDS = 5.0
+
+# Spacing of the samples kept for that window
+SAMPLE_SECONDS = 0.25
+
+# How often the GUIs redraw the progress bar and stats line
+REFRESH_MS = 250
+
+ProgressSnapshot = namedtuple('ProgressSnapshot', 'done total bytes elapsed rate byte_rate eta')
+
+
+class ScanProgress:
+    """Thread-safe scan counters shared by the fetch engine and whoever displays them
+
+    The fetch engine reports bytes with received() as responses arrive and the
+    aggregation step reports messages with advance(); snapshot() can be called
+    from any thread. pause(), resume() and cancel() may also come from any
+    thread: engines call proceed() before each batch, so a cancelled scan stops
+    fetching and finishes with what it already has.
+    """
+
+    def __init__(self, total=0, window=WINDOW_SECONDS, clock=time.monotonic):
+        self._lock = threading.Lock()
+        self.window = window
+        self.clock = clock
+        # Set while the scan may run; cleared by pause()
+        self._running = threading.Event()
+        self._running.set()
+        self._cancelled = threading.Event()
+        self.start(total)
+
+    def start(self, total):
+        """Reset the counters for a scan of total messages"""
+        with self._lock:
+            self.total = total
+            self.done = 0
+            self.bytes = 0
+            self.started = self.clock()
+            self._samples = deque([(self.started, 0, 0)])
+
+    def pause(self):
+        """Hold the scan before its next batch"""
+        self._running.clear()
+
+    def resume(self):
+        """Let a paused scan continue"""
+        self._running.set()
+
+    def cancel(self):
+        """Stop the scan before its next batch, waking it if paused"""
+        self._cancelled.set()
+        self._running.set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def proceed(self):
+        """Block while paused; return False once cancelled"""
+        self._running.wait()
+        return not self._cancelled.is_set()
+
+    def received(self, nbytes):
+        """Count bytes of server responses"""
+        with self._lock:
+            self.bytes += nbytes
+            self._sample()
+
+    def advance(self, messages=1):
+        """Count processed messages and return the new total done"""
+        with self._lock:
+            self.done += messages
+            self._sample()
+            return self.done
+
+    def _sample(self):
+        """Keep one (time, done, bytes) sample per SAMPLE_SECONDS, dropping those older than the window"""
+        now = self.clock()
+        if now - self._samples[-1][0] >= SAMPLE_SECONDS:
+            self._samples.append((now, self.done, self.bytes))
+            while len(self._samples) > 2 and now - self._samples[1][0] >= self.window:
+                self._samples.popleft()
+
+    def snapshot(self):
+        """Current ProgressSnapshot; rates cover the last window seconds, eta is None while unknown"""
+        with self._lock:
+            now = self.clock()
+            # Rates run from the newest sample at least a window old, so they drop to zero during a stall
+            since, done, nbytes = self._samples[0]
+            for sample in self._samples:
+                if sample[0] > now - self.window:
+                    break
+                since, done, nbytes = sample
+            span = now - since
+            rate = (self.done - done) / span if span > 0 else 0.0
+            byte_rate = (self.bytes - nbytes) / span if span > 0 else 0.0
+            remaining = max(0, self.total - self.done)
+            eta = remaining / rate if rate > 0 else (0.0 if not remaining else None)
+            return ProgressSnapshot(self.done, self.total, self.bytes, now - self.started, rate, byte_rate, eta)
+
+
+def format_bytes(nbytes):
+    """Human readable size, e.g. 3.4 MB"""
+    for unit in ('B', 'KB', 'MB'):
+        if nbytes < 1024:
+            return f"{nbytes:.0f} {unit}" if unit == 'B' else f"{nbytes:.1f} {unit}"
+        nbytes /= 1024
+    return f"{nbytes:.1f} GB"
+
+
+def format_duration(seconds):
+    """Duration as m:ss or h:mm:ss"""
+    minutes, seconds = divmod(int(seconds + 0.5), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+def format_progress(snapshot):
+    """One-line summary, e.g. 1200/5000 messages, 850 msg/s, 3.4 MB (1.2 MB/s), ETA 0:04"""
+    eta = format_duration(snapshot.eta) if snapshot.eta is not None else '--:--'
+    return (f"{snapshot.done}/{snapshot.total} messages, {snapshot.rate:.0f} msg/s, "
+            f"{format_bytes(snapshot.bytes)} ({format_bytes(snapshot.byte_rate)}/s), ETA {eta}")
+
+
+def percent_done(snapshot):
+    """Share of the scan done, 0-100"""
+    return 100.0 * snapshot.done / snapshot.total if snapshot.total else 0.0
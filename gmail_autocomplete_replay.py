@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""
+Gmail Autocomplete Builder - IMAP Session Record and Replay
+Captures the IMAP traffic of a scan to a compressed log (--record) and plays
+it back to the scan engines without a server (--replay)
+
+The log is gzip-compressed records of (connection, direction, seconds since
+the connection opened, bytes), captured at the client's read and send calls.
+LOGIN passwords are replaced before anything is written. A replayed client
+is answered command by command from the recording, so replay with the
+same scan options as the recording.
+"""
+
+import asyncio
+import gzip
+import imaplib
+import re
+import struct
+import threading
+import time
+from collections import deque
+
+# How replayed server data is paced: as recorded after each client command, or as fast as possible
+REPLAY_TIMINGS = ('original', 'none')
+
+CLIENT, SERVER = 0, 1
+
+_MAGIC = b'GMAIL-AUTOCOMPLETE-IMAPLOG 1\n'
+_RECORD = struct.Struct('<IBdI')
+
+_LOGIN_RE = re.compile(rb'^(\S+ LOGIN \S+ ).*\r\n$', re.IGNORECASE | re.DOTALL)
+_TAGGED_RE = re.compile(rb'^([^\s*+]+) (.*)$', re.DOTALL)
+_ESEARCH_TAG_RE = re.compile(rb'^(\* ESEARCH \(TAG ")([^"]*)(")')
+
+
+class ReplayError(Exception):
+    """A replayed client did not follow the recorded session"""
+
+
+def _redact(data):
+    """Client bytes with any LOGIN password masked"""
+    return _LOGIN_RE.sub(rb'\1"********"\r\n', data)
+
+
+def _tag(data):
+    """Tag of a client command line, or None"""
+    match = _TAGGED_RE.match(data)
+    return match.group(1) if match else None
+
+
+def _command_key(data):
+    """Client bytes without their tag, and LOGIN without its arguments"""
+    match = _TAGGED_RE.match(data)
+    if not match:
+        return data
+    command = match.group(2)
+    return b'LOGIN' if command[:6].upper() == b'LOGIN ' else command
+
+
+class _Capture:
+    """One connection's side of a SessionRecorder"""
+
+    def __init__(self, recorder, connection):
+        self.recorder = recorder
+        self.connection = connection
+        self.opened = time.monotonic()
+
+    def server(self, data):
+        if data:
+            self.recorder.write(self.connection, SERVER, time.monotonic() - self.opened, data)
+
+    def client(self, data):
+        self.recorder.write(self.connection, CLIENT, time.monotonic() - self.opened, _redact(data))
+
+
+class _RecordingMixin:
+    """Copies every read and send of an imaplib connection to a capture"""
+
+    def __init__(self, capture, *args, **kwargs):
+        self.capture = capture
+        super().__init__(*args, **kwargs)
+
+    def read(self, size):
+        data = super().read(size)
+        self.capture.server(data)
+        return data
+
+    def readline(self):
+        line = super().readline()
+        self.capture.server(line)
+        return line
+
+    def send(self, data):
+        self.capture.client(data)
+        super().send(data)
+
+
+class RecordingIMAP4(_RecordingMixin, imaplib.IMAP4):
+    """Plain imaplib.IMAP4 whose traffic goes to a SessionRecorder"""
+
+
+class RecordingIMAP4_SSL(_RecordingMixin, imaplib.IMAP4_SSL):
+    """imaplib.IMAP4_SSL whose traffic goes to a SessionRecorder"""
+
+
+class RecordingReader:
+    """asyncio StreamReader stand-in that captures what is read"""
+
+    def __init__(self, reader, capture):
+        self.reader = reader
+        self.capture = capture
+
+    async def readline(self):
+        line = await self.reader.readline()
+        self.capture.server(line)
+        return line
+
+    async def readexactly(self, size):
+        data = await self.reader.readexactly(size)
+        self.capture.server(data)
+        return data
+
+
+class RecordingWriter:
+    """asyncio StreamWriter stand-in that captures what is written"""
+
+    def __init__(self, writer, capture):
+        self.writer = writer
+        self.capture = capture
+
+    def write(self, data):
+        self.capture.client(data)
+        self.writer.write(data)
+
+    async def drain(self):
+        await self.writer.drain()
+
+    def close(self):
+        self.writer.close()
+
+
+class SessionRecorder:
+    """Writes the traffic of every connection of a scan to one compressed log"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = gzip.open(path, 'wb')
+        self._file.write(_MAGIC)
+        self._lock = threading.Lock()
+        self._connections = 0
+        self.bytes = 0
+
+    def _capture(self):
+        with self._lock:
+            self._connections += 1
+            return _Capture(self, self._connections - 1)
+
+    def write(self, connection, direction, elapsed, data):
+        """Append one record; safe to call from several connection threads"""
+        with self._lock:
+            self._file.write(_RECORD.pack(connection, direction, elapsed, len(data)) + data)
+            self.bytes += len(data)
+
+    def open(self, host, port, ssl_context=None):
+        """Open a recorded imaplib connection, over TLS unless ssl_context is None"""
+        if ssl_context is None:
+            return RecordingIMAP4(self._capture(), host, port)
+        return RecordingIMAP4_SSL(self._capture(), host, port, ssl_context=ssl_context)
+
+    def wrap_async(self, reader, writer):
+        """Recording (reader, writer) for a new asyncio connection"""
+        capture = self._capture()
+        return RecordingReader(reader, capture), RecordingWriter(writer, capture)
+
+    def close(self):
+        self._file.close()
+
+
+def read_session(path):
+    """{connection: [(direction, elapsed, data), ...]} from a session log"""
+    connections = {}
+    with gzip.open(path, 'rb') as log:
+        if log.read(len(_MAGIC)) != _MAGIC:
+            raise ReplayError(f"{path} is not an IMAP session log")
+        while True:
+            header = log.read(_RECORD.size)
+            if not header:
+                break
+            if len(header) < _RECORD.size:
+                raise ReplayError(f"{path} is truncated")
+            connection, direction, elapsed, size = _RECORD.unpack(header)
+            connections.setdefault(connection, []).append((direction, elapsed, log.read(size)))
+    return connections
+
+
+def _split_replies(records):
+    """(greeting, [(command key, tag, sent at, [(elapsed, data)])]) of one recorded connection
+
+    Server data belongs to the oldest command still running, up to and
+    including the tagged line that completes it (servers answer in order).
+    """
+    greeting, replies, running = [], [], []
+    for direction, elapsed, data in records:
+        if direction == CLIENT:
+            tag = _tag(data)
+            # Literal data sent after a continuation belongs to the command before it
+            if tag and data.endswith(b'\r\n'):
+                reply = (_command_key(data), tag, elapsed, [])
+                replies.append(reply)
+                running.append(reply)
+        elif running:
+            running[0][3].append((elapsed, data))
+            tag = _tag(data)
+            for reply in running:
+                if reply[1] == tag:
+                    running.remove(reply)
+                    break
+        elif replies:
+            # Untagged data after every command finished
+            replies[-1][3].append((elapsed, data))
+        else:
+            greeting.append((elapsed, data))
+    
+    # imaplib stops reading at LOGOUT's BYE; complete whatever was cut short
+    for key, tag, sent_at, chunks in running:
+        chunks.append((chunks[-1][0] if chunks else sent_at, tag + b' OK Completed\r\n'))
+    return greeting, replies
+
+
+class _Reply:
+    """Recorded server data owed to one replayed command"""
+
+    def __init__(self, sent_at, recorded_at, chunks, recorded_tag=None, tag=None):
+        self.sent_at = sent_at
+        self.recorded_at = recorded_at
+        self.chunks = chunks
+        self.recorded_tag = recorded_tag
+        self.tag = tag
+        self.position = 0
+
+    def retag(self, data):
+        """Recorded server bytes with the recorded tag swapped for the client's"""
+        if self.recorded_tag is None:
+            return data
+        if data.startswith(self.recorded_tag + b' '):
+            return self.tag + data[len(self.recorded_tag):]
+        match = _ESEARCH_TAG_RE.match(data)
+        if match and match.group(2) == self.recorded_tag:
+            return match.group(1) + self.tag + data[match.end(2):]
+        return data
+
+
+class ReplayStream:
+    """Server side of one replayed connection
+
+    Each command the client sends is answered with the recorded reply to
+    the same command (tags aside) from any recorded connection, so
+    connections that open in another order or share out batches
+    differently still get the right data. Replies come back in command
+    order, and with 'original' timing no sooner after their command than
+    in the recording.
+    """
+
+    def __init__(self, replay):
+        self.replay = replay
+        self.buffer = bytearray()
+        self.replies = deque([_Reply(time.monotonic(), 0.0, replay.take_greeting())])
+
+    def send(self, data):
+        """Take bytes from the client and queue the recorded reply to them"""
+        tag = _tag(data)
+        if tag and data.endswith(b'\r\n'):
+            recorded_tag, recorded_at, chunks = self.replay.take_reply(_command_key(data))
+            self.replies.append(_Reply(time.monotonic(), recorded_at, chunks, recorded_tag, tag))
+
+    def poll(self):
+        """Move the next due server chunk into the buffer
+
+        Returns None when it did, 'send' while waiting for a command, or
+        seconds to wait for the chunk to be due.
+        """
+        while self.replies and self.replies[0].position >= len(self.replies[0].chunks):
+            self.replies.popleft()
+        if not self.replies:
+            return 'send'
+        reply = self.replies[0]
+        elapsed, data = reply.chunks[reply.position]
+        if self.replay.timing == 'original':
+            # Keep the recorded delay after the command was sent
+            wait = reply.sent_at + (elapsed - reply.recorded_at) - time.monotonic()
+            if wait > 0:
+                return wait
+        reply.position += 1
+        self.buffer += reply.retag(data)
+        return None
+
+    def take_line(self):
+        """A complete line from the buffer, or None"""
+        end = self.buffer.find(b'\n')
+        if end < 0:
+            return None
+        line = bytes(self.buffer[:end + 1])
+        del self.buffer[:end + 1]
+        return line
+
+    def take(self, size):
+        """size bytes from the buffer, or None if it holds fewer"""
+        if len(self.buffer) < size:
+            return None
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def pump(self):
+        """Blocking poll for a synchronous client"""
+        while True:
+            state = self.poll()
+            if state is None:
+                return
+            if state == 'send':
+                raise ReplayError("The scan is waiting for a reply to a command it never sent")
+            time.sleep(state)
+
+    async def pump_async(self, sent):
+        """poll() for an asyncio client, waiting on the sent event for new commands"""
+        while True:
+            state = self.poll()
+            if state is None:
+                return
+            if state == 'send':
+                sent.clear()
+                await sent.wait()
+            else:
+                await asyncio.sleep(state)
+
+
+class ReplayIMAP4(imaplib.IMAP4):
+    """imaplib.IMAP4 reading from a ReplayStream instead of a socket"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        super().__init__()
+
+    def open(self, host='', port=imaplib.IMAP4_PORT, timeout=None):
+        self.host, self.port = host, port
+        self.sock = None
+
+    def read(self, size):
+        data = self.stream.take(size)
+        while data is None:
+            self.stream.pump()
+            data = self.stream.take(size)
+        return data
+
+    def readline(self):
+        line = self.stream.take_line()
+        while line is None:
+            self.stream.pump()
+            line = self.stream.take_line()
+        return line
+
+    def send(self, data):
+        self.stream.send(data)
+
+    def shutdown(self):
+        pass
+
+
+class ReplayReader:
+    """asyncio StreamReader stand-in reading from a ReplayStream"""
+
+    def __init__(self, stream, sent):
+        self.stream = stream
+        self.sent = sent
+
+    async def readline(self):
+        line = self.stream.take_line()
+        while line is None:
+            await self.stream.pump_async(self.sent)
+            line = self.stream.take_line()
+        return line
+
+    async def readexactly(self, size):
+        data = self.stream.take(size)
+        while data is None:
+            await self.stream.pump_async(self.sent)
+            data = self.stream.take(size)
+        return data
+
+
+class ReplayWriter:
+    """asyncio StreamWriter stand-in sending to a ReplayStream"""
+
+    def __init__(self, stream, sent):
+        self.stream = stream
+        self.sent = sent
+
+    def write(self, data):
+        self.stream.send(data)
+        self.sent.set()
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SessionReplay:
+    """Plays a recorded session to new connections, with the original timing or none"""
+
+    def __init__(self, path, timing='original'):
+        self.path = path
+        self.timing = timing
+        self.greetings = deque()
+        self.replies = {}
+        for connection, records in sorted(read_session(path).items()):
+            greeting, replies = _split_replies(records)
+            self.greetings.append(greeting)
+            for key, tag, sent_at, chunks in replies:
+                self.replies.setdefault(key, deque()).append((tag, sent_at, chunks))
+        self.lock = threading.Lock()
+
+    def take_greeting(self):
+        """Server greeting of the next recorded connection"""
+        with self.lock:
+            if not self.greetings:
+                raise ReplayError("The scan opened more connections than the recorded session")
+            return self.greetings.popleft()
+
+    def take_reply(self, key):
+        """(tag, sent at, chunks) of an unused recorded reply to a command"""
+        with self.lock:
+            replies = self.replies.get(key)
+            if not replies:
+                raise ReplayError(f"The recording has no reply to {key[:80]!r} "
+                                  "(replay with the same scan options as the recording)")
+            return replies.popleft()
+
+    def open(self):
+        """A replayed imaplib connection"""
+        return ReplayIMAP4(ReplayStream(self))
+
+    def open_async(self):
+        """(reader, writer) of a replayed asyncio connection; call from the event loop"""
+        stream, sent = ReplayStream(self), asyncio.Event()
+        return ReplayReader(stream, sent), ReplayWriter(stream, sent)
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Gmail Autocomplete Builder - Approximate Counting
+Fixed-memory contact counts for very large mailboxes (--approximate)
+
+Error bounds, with N the total number of recipient occurrences counted:
+- Count-Min: an estimate never undercounts, and overcounts by at most
+  e / width * N with probability 1 - exp(-depth). The defaults allow about
+  0.004% of N at 98% confidence.
+- Top list: keeps the capacity addresses with the highest estimates, so
+  it can only miss an address whose count is within the Count-Min error
+  of the smallest one kept.
+- HyperLogLog: distinct addresses within about 1.04 / sqrt(2 ** precision)
+  relative standard error, 0.8% with the defaults.
+"""
+
+from array import array
+import hashlib
+import heapq
+import math
+
+from gmail_autocomplete_contacts import HALF_LIFE_DAYS, NO_SCORE, decay_rate, log_add
+
+# Count-Min sketch shape: 65536 x 4 counters, 2 MB
+SKETCH_WIDTH = 1 << 16
+SKETCH_DEPTH = 4
+
+# Addresses tracked as heavy hitters
+TOP_CAPACITY = 10000
+
+# HyperLogLog registers: 2 ** 14, 16 KB
+HLL_PRECISION = 14
+
+
+def address_hash(address):
+    """Stable 64-bit hash of an address, the same in every process and run, so sketches can be merged"""
+    return int.from_bytes(hashlib.blake2b(address.encode(), digest_size=8).digest(), 'little')
+
+
+class CountMinSketch:
+    """Frequency estimates that never undercount, in width * depth counters"""
+
+    def __init__(self, width=SKETCH_WIDTH, depth=SKETCH_DEPTH):
+        self.width = width
+        self.depth = depth
+        self.total = 0
+        self.rows = [array('Q', bytes(8 * width)) for _ in range(depth)]
+
+    def _columns(self, hashed):
+        # Double hashing: row i uses h1 + i * h2 (Kirsch-Mitzenmacher)
+        h1, h2 = hashed & 0xFFFFFFFF, (hashed >> 32) | 1
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add(self, hashed, count=1):
+        """Count an item by its 64-bit hash; returns its new estimate"""
+        self.total += count
+        estimate = None
+        for row, column in zip(self.rows, self._columns(hashed)):
+            row[column] += count
+            estimate = row[column] if estimate is None else min(estimate, row[column])
+        return estimate
+
+    def estimate(self, hashed):
+        """Upper bound on an item's count, tight to e / width * total with high probability"""
+        return min(row[column] for row, column in zip(self.rows, self._columns(hashed)))
+
+    def merge(self, other):
+        """Add another sketch of the same shape"""
+        self.total += other.total
+        for row, other_row in zip(self.rows, other.rows):
+            for column, value in enumerate(other_row):
+                if value:
+                    row[column] += value
+
+    def error_bound(self):
+        """(overcount limit, confidence) of estimate() at the current total"""
+        return math.e / self.width * self.total, 1 - math.exp(-self.depth)
+
+
+class SpaceSaving:
+    """The most frequent items of a stream, holding at most capacity of them
+
+    Entries are [count, name, last_used, score]. As in Space-Saving, a full table
+    evicts its smallest entry for a newcomer, but counts are the Count-Min
+    estimates passed in rather than inherited minimums, so a long tail of
+    one-off addresses cannot churn real contacts out of the table.
+    """
+
+    def __init__(self, capacity=TOP_CAPACITY):
+        self.capacity = capacity
+        self.entries = {}
+        self._heap = []
+
+    def offer(self, item, estimate, name='', last_used=0, score=NO_SCORE):
+        """Track an item at its current estimated count if it ranks in the top capacity
+
+        score is the log frecency score of this use, summed while the item is tracked.
+        """
+        entry = self.entries.get(item)
+        if entry is None:
+            if len(self.entries) >= self.capacity:
+                if estimate <= self._smallest()[0]:
+                    return
+                del self.entries[heapq.heappop(self._heap)[1]]
+            entry = self.entries[item] = [estimate, name, last_used, score]
+        else:
+            entry[0] = estimate
+            if name and not entry[1]:
+                entry[1] = name
+            if last_used > entry[2]:
+                entry[2] = last_used
+            entry[3] = log_add(entry[3], score)
+        heapq.heappush(self._heap, (estimate, item))
+
+        # The heap holds stale (count, item) pairs; rebuild it before it dwarfs the entries
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(entry[0], key) for key, entry in self.entries.items()]
+            heapq.heapify(self._heap)
+
+    def _smallest(self):
+        """(count, item) of the tracked item with the lowest count, left at the top of the heap"""
+        while True:
+            count, item = self._heap[0]
+            entry = self.entries.get(item)
+            if entry is not None and entry[0] == count:
+                return count, item
+            heapq.heappop(self._heap)
+
+
+class HyperLogLog:
+    """Distinct-item count estimate in 2 ** precision one-byte registers"""
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, hashed):
+        """Add an item by its 64-bit hash"""
+        index = hashed >> (64 - self.precision)
+        rest_bits = 64 - self.precision
+        rank = rest_bits - (hashed & ((1 << rest_bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """Union with another HyperLogLog of the same precision"""
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def __len__(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def relative_error(self):
+        """Relative standard error of len()"""
+        return 1.04 / math.sqrt(len(self.registers))
+
+
+class ApproximateContacts:
+    """ContactStore stand-in whose memory does not grow with the mailbox
+
+    Counts come from a Count-Min sketch, the heavy hitters (with their
+    names and last-used times) from Space-Saving, and len() from a
+    HyperLogLog. Frecency scores only cover the uses seen while an address
+    was in the top table.
+    """
+
+    def __init__(self, capacity=TOP_CAPACITY, width=SKETCH_WIDTH, depth=SKETCH_DEPTH, precision=HLL_PRECISION,
+                 half_life_days=HALF_LIFE_DAYS):
+        self.half_life_days = half_life_days
+        self._rate = decay_rate(half_life_days)
+        self.sketch = CountMinSketch(width, depth)
+        self.top = SpaceSaving(capacity)
+        self.distinct = HyperLogLog(precision)
+
+    def __len__(self):
+        return len(self.distinct)
+
+    def add(self, address, count=1, name='', last_used=0, score=None):
+        """Add count uses of address, with their log frecency score as in ContactStore.add"""
+        if score is None:
+            score = self._rate * last_used + math.log(count) if last_used and count else NO_SCORE
+        hashed = address_hash(address)
+        estimate = self.sketch.add(hashed, count)
+        self.distinct.add(hashed)
+        self.top.offer(address, estimate, name, last_used, score)
+
+    def record(self, addresses, last_used=0):
+        """Add one use of each (address, name) pair of a message sent at last_used"""
+        for address, name in addresses:
+            self.add(address, 1, name, last_used)
+
+    def merge(self, other):
+        """Add a ContactStore, or another ApproximateContacts of the same shape"""
+        if not isinstance(other, ApproximateContacts):
+            for address, count, name, last_used, score in other.items():
+                self.add(address, count, name, last_used, score)
+            return
+        self.sketch.merge(other.sketch)
+        self.distinct.merge(other.distinct)
+        
+        # Re-rank both top lists against the merged sketch
+        entries = list(self.top.entries.items()) + list(other.top.entries.items())
+        self.top = SpaceSaving(self.top.capacity)
+        for address, (count, name, last_used, score) in entries:
+            self.top.offer(address, self.count(address), name, last_used, score)
+
+    def count(self, address):
+        """Estimated uses of address: never low, high by at most the Count-Min bound"""
+        return self.sketch.estimate(address_hash(address))
+
+    def items(self):
+        """Yield (address, count, name, last_used, score) for the tracked heavy hitters"""
+        for address, (count, name, last_used, score) in self.top.entries.items():
+            yield address, self.count(address), name, last_used, score
+
+    def most_common(self, n=None, rank='count'):
+        """Heavy hitters ranked by 'count' or 'frecency', best first"""
+        column = 1 if rank == 'count' else 4
+        rows = sorted(self.items(), key=lambda row: row[column], reverse=True)
+        return rows if n is None else rows[:n]
+
+    def error_summary(self):
+        """One-line description of the current error bounds"""
+        overcount, confidence = self.sketch.error_bound()
+        return (f"counts within +{overcount:.1f} at {confidence:.0%} confidence, "
+                f"distinct addresses within ±{self.distinct.relative_error():.1%}")
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Gmail Autocomplete Builder - Scan Checkpoints
+SQLite store of UIDVALIDITY, highest scanned UID, message limit, filter and contact counters per folder
+"""
+
+import os
+import sqlite3
+from datetime import datetime
+
+# Bumped when the tables change; older state files are discarded
+SCHEMA_VERSION = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS folders (
+    account     TEXT NOT NULL,
+    folder      TEXT NOT NULL,
+    uidvalidity INTEGER NOT NULL,
+    last_uid    INTEGER NOT NULL,
+    half_life   REAL NOT NULL,
+    max_messages INTEGER NOT NULL,
+    scan_filter TEXT NOT NULL,
+    updated     TEXT NOT NULL,
+    PRIMARY KEY (account, folder)
+);
+CREATE TABLE IF NOT EXISTS contacts (
+    account     TEXT NOT NULL,
+    folder      TEXT NOT NULL,
+    address     TEXT NOT NULL,
+    count       INTEGER NOT NULL,
+    name        TEXT NOT NULL,
+    last_used   INTEGER NOT NULL,
+    score       REAL NOT NULL,
+    PRIMARY KEY (account, folder, address)
+);
+"""
+
+
+def default_state_path(csv_path):
+    """State file kept next to the output CSV, e.g. outlook_contacts.state.sqlite"""
+    return os.path.splitext(csv_path)[0] + '.state.sqlite'
+
+
+def scan_filter(since=None, before=None, gmail_query=None):
+    """Text identifying a scan's --since/--before/--gmail-query, empty when unfiltered"""
+    parts = [f"since {since}" if since else '', f"before {before}" if before else '',
+             f"query {gmail_query}" if gmail_query else '']
+    return ' '.join(part for part in parts if part)
+
+
+class CheckpointStore:
+    """Remembers how far each folder was scanned so reruns only fetch new UIDs"""
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            # Older files lack epoch dates or frecency scores; start over with a full rescan
+            self.db.executescript("DROP TABLE IF EXISTS folders; DROP TABLE IF EXISTS contacts;")
+            self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.db.executescript(SCHEMA)
+
+    def load(self, account, folder):
+        """Return (uidvalidity, last_uid, half_life, max_messages, scan_filter) for a folder, or None if never scanned
+
+        max_messages is the limit of the full scan the checkpoint started from:
+        messages older than that window were never counted. scan_filter is the
+        scan_filter() of the date and Gmail filters the counts were taken with.
+        """
+        row = self.db.execute(
+            "SELECT uidvalidity, last_uid, half_life, max_messages, scan_filter FROM folders WHERE account = ? AND folder = ?",
+            (account.lower(), folder)).fetchone()
+        return tuple(row) if row else None
+
+    def load_counters(self, account, folder, contacts):
+        """Add the contacts saved for a folder to a ContactStore"""
+        rows = self.db.execute(
+            "SELECT address, count, name, last_used, score FROM contacts WHERE account = ? AND folder = ?",
+            (account.lower(), folder))
+        for address, count, name, last_used, score in rows:
+            contacts.add(address, count, name, last_used, score)
+
+    def save(self, account, folder, uidvalidity, last_uid, contacts, half_life_days, max_messages, scan_filter=''):
+        """Replace a folder's checkpoint and contacts in one transaction"""
+        account = account.lower()
+        with self.db:
+            self.db.execute("DELETE FROM contacts WHERE account = ? AND folder = ?", (account, folder))
+            self.db.executemany(
+                "INSERT INTO contacts VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((account, folder, address, count, name, last_used, score)
+                 for address, count, name, last_used, score in contacts.items()))
+            self.db.execute(
+                "INSERT OR REPLACE INTO folders VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (account, folder, uidvalidity, last_uid, half_life_days, max_messages, scan_filter, datetime.now().isoformat(timespec='seconds')))
+
+    def close(self):
+        """Close the database"""
+        self.db.close()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Gmail Autocomplete Builder - GUI Contact Views
+Live top-contacts table updated from snapshot diffs, and a post-scan contact
+browser that loads rows lazily, filters through a sorted index and prunes contacts
+"""
+
+import bisect
+import heapq
+import tkinter as tk
+from tkinter import ttk
+
+# Contacts shown in the live table
+TOP_ROWS = 50
+
+# Seconds between snapshots the scan thread posts to the live table
+LIVE_REFRESH_SECONDS = 1.0
+
+LIVE_COLUMNS = (('rank', '#', 40), ('name', 'Name', 160), ('email', 'Email', 220), ('count', 'Messages', 80))
+
+BROWSER_COLUMNS = (('name', 'Name', 200), ('email', 'Email', 260), ('count', 'Messages', 80))
+
+# Rows the browser adds to its Treeview each time the user scrolls near the end
+PAGE_ROWS = 200
+
+# Position of each sortable column in a ContactIndex record
+_FIELDS = {'email': 0, 'name': 1, 'count': 2}
+
+# Appended to a prefix, sorts after every key that starts with it
+_PREFIX_END = '\U0010ffff'
+
+
+def top_contacts(email_addresses, limit=TOP_ROWS):
+    """Snapshot of the most contacted addresses as (email, name, count) tuples, best first
+
+    email_addresses is the GUIs' {email: {'count', 'name', ...}} table. Call it
+    from the thread that updates the table; the tuples are safe to hand to Tk.
+    """
+    top = heapq.nlargest(limit, email_addresses.items(), key=lambda item: item[1]['count'])
+    return [(email_addr, info['name'], info['count']) for email_addr, info in top]
+
+
+def make_tree(parent, columns, height=8):
+    """Headings-only Treeview with a vertical scrollbar, gridded into parent; returns (tree, scrollbar)"""
+    tree = ttk.Treeview(parent, columns=[name for name, _, _ in columns], show='headings', height=height)
+    for name, heading, width in columns:
+        anchor = tk.E if name in ('rank', 'count') else tk.W
+        tree.heading(name, text=heading, anchor=anchor)
+        tree.column(name, width=width, anchor=anchor, stretch=name in ('name', 'email'))
+    scrollbar = ttk.Scrollbar(parent, orient=tk.VERTICAL, command=tree.yview)
+    tree.configure(yscrollcommand=scrollbar.set)
+    tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+    scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
+    parent.columnconfigure(0, weight=1)
+    parent.rowconfigure(0, weight=1)
+    return tree, scrollbar
+
+
+class LiveContactsView:
+    """Treeview of the top contacts that only touches the rows a new snapshot changed
+
+    Rows are keyed by address: contacts that dropped out are deleted, new ones
+    inserted, and existing rows are moved or given new values only when their
+    rank or count differ from the previous snapshot.
+    """
+
+    def __init__(self, parent, height=8):
+        self.tree, _ = make_tree(parent, LIVE_COLUMNS, height)
+        self.rows = {}
+
+    def update(self, snapshot):
+        """Show a top_contacts() snapshot"""
+        rows = {email_addr: (rank, name, email_addr, count)
+                for rank, (email_addr, name, count) in enumerate(snapshot, 1)}
+        for email_addr in self.rows.keys() - rows.keys():
+            self.tree.delete(email_addr)
+
+        order = list(self.tree.get_children())
+        for index, (email_addr, name, count) in enumerate(snapshot):
+            values = rows[email_addr]
+            if email_addr not in self.rows:
+                self.tree.insert('', index, iid=email_addr, values=values)
+                order.insert(index, email_addr)
+                continue
+            if self.rows[email_addr] != values:
+                self.tree.item(email_addr, values=values)
+            if order[index] != email_addr:
+                self.tree.move(email_addr, '', index)
+                order.remove(email_addr)
+                order.insert(index, email_addr)
+        self.rows = rows
+
+
+class ContactIndex:
+    """Contacts of a finished scan as (email, name, count) records addressed by position
+
+    Sorting yields a permutation of record ids, computed once per column and
+    reused reversed for descending order, so re-sorting never copies records.
+    Prefix filtering bisects a sorted list of every address and name word.
+    """
+
+    def __init__(self, email_addresses):
+        self.records = [(email_addr, info['name'], info['count']) for email_addr, info in email_addresses.items()]
+        self.removed = set()
+        self._orders = {}
+        keys = []
+        for record_id, (email_addr, name, _) in enumerate(self.records):
+            keys.append((email_addr.lower(), record_id))
+            keys.extend((word, record_id) for word in name.lower().split())
+        keys.sort()
+        self._keys = [key for key, _ in keys]
+        self._key_ids = [record_id for _, record_id in keys]
+
+    def __len__(self):
+        return len(self.records) - len(self.removed)
+
+    def order(self, column, descending=False):
+        """Record ids sorted on column (email, name or count)"""
+        if column not in self._orders:
+            field = _FIELDS[column]
+            if column == 'count':
+                key = lambda record_id: self.records[record_id][field]
+            else:
+                key = lambda record_id: self.records[record_id][field].lower()
+            self._orders[column] = sorted(range(len(self.records)), key=key)
+        ids = self._orders[column]
+        return reversed(ids) if descending else ids
+
+    def matching(self, query):
+        """Ids of contacts with an address or name word starting with every word of query"""
+        matches = None
+        for word in query.lower().split():
+            start = bisect.bisect_left(self._keys, word)
+            end = bisect.bisect_left(self._keys, word + _PREFIX_END, start)
+            found = set(self._key_ids[start:end])
+            matches = found if matches is None else matches & found
+        return matches
+
+    def rows(self, column, descending=False, query=''):
+        """Ids of the contacts to show, in display order"""
+        matches = self.matching(query)
+        removed = self.removed
+        if matches is None:
+            return [record_id for record_id in self.order(column, descending) if record_id not in removed]
+        return [record_id for record_id in self.order(column, descending)
+                if record_id in matches and record_id not in removed]
+
+
+class ContactBrowser:
+    """Window for reviewing and pruning contacts after a scan
+
+    The Treeview only ever holds the rows the user has scrolled to: PAGE_ROWS
+    are inserted at a time when the scrollbar nears the end. Removing contacts
+    deletes them from email_addresses, so the next export leaves them out.
+    """
+
+    def __init__(self, parent, email_addresses, on_export=None):
+        self.email_addresses = email_addresses
+        self.index = ContactIndex(email_addresses)
+        self.sort_column = 'count'
+        self.descending = True
+        self.rows = []
+        self.loaded = 0
+        
+        self.window = tk.Toplevel(parent)
+        self.window.title("Contacts")
+        self.window.geometry("620x520")
+        frame = ttk.Frame(self.window, padding="10")
+        frame.pack(fill=tk.BOTH, expand=True)
+        frame.columnconfigure(1, weight=1)
+        frame.rowconfigure(1, weight=1)
+        
+        # Filter box, applied on every keystroke
+        ttk.Label(frame, text="Filter:").grid(row=0, column=0, sticky=tk.W)
+        self.filter_var = tk.StringVar()
+        filter_entry = ttk.Entry(frame, textvariable=self.filter_var)
+        filter_entry.grid(row=0, column=1, sticky=(tk.W, tk.E), padx=(5, 0), pady=(0, 5))
+        filter_entry.focus_set()
+        self.filter_var.trace_add('write', lambda *_: self.refresh())
+        
+        # Contact table
+        table_frame = ttk.Frame(frame)
+        table_frame.grid(row=1, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.tree, self.scrollbar = make_tree(table_frame, BROWSER_COLUMNS, height=18)
+        self.tree.configure(yscrollcommand=self.on_scroll)
+        for name, _, _ in BROWSER_COLUMNS:
+            self.tree.heading(name, command=lambda column=name: self.sort_by(column))
+        self.tree.bind('<Delete>', lambda e: self.remove_selected())
+        self.tree.bind('<BackSpace>', lambda e: self.remove_selected())
+        
+        # Counts and actions
+        bottom = ttk.Frame(frame)
+        bottom.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(5, 0))
+        self.count_var = tk.StringVar()
+        ttk.Label(bottom, textvariable=self.count_var).pack(side=tk.LEFT)
+        if on_export:
+            ttk.Button(bottom, text="Export CSV", command=on_export).pack(side=tk.RIGHT)
+        ttk.Button(bottom, text="Remove Selected", command=self.remove_selected).pack(side=tk.RIGHT, padx=5)
+        
+        self.refresh()
+
+    def refresh(self):
+        """Rebuild the row order for the current sort and filter and show its first page"""
+        self.rows = self.index.rows(self.sort_column, self.descending, self.filter_var.get())
+        self.tree.delete(*self.tree.get_children())
+        self.loaded = 0
+        self.load_page()
+        self.tree.yview_moveto(0)
+        for name, heading, _ in BROWSER_COLUMNS:
+            arrow = (' ▼' if self.descending else ' ▲') if name == self.sort_column else ''
+            self.tree.heading(name, text=heading + arrow)
+        self.update_count()
+
+    def load_page(self):
+        """Insert the next PAGE_ROWS rows at the end of the Treeview"""
+        records = self.index.records
+        end = min(self.loaded + PAGE_ROWS, len(self.rows))
+        for record_id in self.rows[self.loaded:end]:
+            email_addr, name, count = records[record_id]
+            self.tree.insert('', tk.END, iid=str(record_id), values=(name, email_addr, count))
+        self.loaded = end
+
+    def on_scroll(self, first, last):
+        """yscrollcommand: move the scrollbar and load another page near the end"""
+        self.scrollbar.set(first, last)
+        if float(last) > 0.9 and self.loaded < len(self.rows):
+            self.load_page()
+
+    def sort_by(self, column):
+        """Sort on a column; clicking it again reverses the order"""
+        if column == self.sort_column:
+            self.descending = not self.descending
+        else:
+            self.sort_column = column
+            self.descending = column == 'count'
+        self.refresh()
+
+    def remove_selected(self):
+        """Drop the selected contacts from the table and from the export"""
+        selected = self.tree.selection()
+        if not selected:
+            return
+        ids = {int(iid) for iid in selected}
+        for record_id in ids:
+            self.email_addresses.pop(self.index.records[record_id][0], None)
+        self.index.removed.update(ids)
+        self.tree.delete(*selected)
+        # Every selected row was loaded, so the loaded prefix shrinks by exactly that many
+        self.rows = [record_id for record_id in self.rows if record_id not in ids]
+        self.loaded -= len(ids)
+        if self.loaded < PAGE_ROWS:
+            self.load_page()
+        self.update_count()
+
+    def update_count(self):
+        removed = len(self.index.removed)
+        self.count_var.set(f"Showing {len(self.rows)} of {len(self.index)} contacts" +
+                           (f", {removed} removed" if removed else ""))
+
+    def close(self):
+        """Close the window if it is still open"""
+        if self.window.winfo_exists():
+            self.window.destroy()